@@ -0,0 +1,98 @@
+import math
+import os
+import time
+from collections import OrderedDict
+
+from hashing import hasher, HASH_TARGET_MS
+
+# Лимиты для эндпоинтов с bcrypt: емкость корзины и скорость пополнения (токенов в секунду)
+IP_BUCKET_CAPACITY = float(os.getenv("AUTH_IP_BURST", "20"))
+IP_BUCKET_RATE = float(os.getenv("AUTH_IP_RATE", "2"))
+EMAIL_BUCKET_CAPACITY = float(os.getenv("AUTH_EMAIL_BURST", "5"))
+EMAIL_BUCKET_RATE = float(os.getenv("AUTH_EMAIL_RATE", "0.1"))
+MAX_TRACKED_KEYS = int(os.getenv("AUTH_MAX_TRACKED_KEYS", "100000"))
+# Начинаем отказывать, когда очередь хэширования заполнена на эту долю
+HASH_SHED_RATIO = float(os.getenv("HASH_SHED_RATIO", "0.75"))
+# Адреса прокси, которым доверяем X-Forwarded-For. Flask-фронтенд ходит в API
+# со своего адреса, поэтому без этого все пользователи сайта делили бы одну корзину
+TRUSTED_PROXIES = frozenset(ip.strip() for ip in os.getenv("TRUSTED_PROXIES", "127.0.0.1,::1").split(",") if ip.strip())
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code, detail, retry_after):
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, capacity, now):
+        self.tokens = capacity
+        self.updated = now
+
+    # Возвращает 0, если токен взят, иначе сколько секунд ждать
+    def take(self, capacity, rate, now):
+        self.tokens = min(capacity, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / rate
+
+
+class BucketTable:
+    # Корзины по ключу (IP или email) с вытеснением давно не использованных ключей
+    def __init__(self, capacity, rate, max_keys=MAX_TRACKED_KEYS):
+        self.capacity = capacity
+        self.rate = rate
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+
+    def take(self, key, now):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.capacity, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket.take(self.capacity, self.rate, now)
+
+
+# Адрес клиента для лимитов: от доверенного прокси берем последний недоверенный адрес
+# из X-Forwarded-For (левее него значения может подставить сам клиент)
+def client_ip(request):
+    ip = request.client.host if request.client else ""
+    if ip not in TRUSTED_PROXIES:
+        return ip
+    forwarded = request.headers.get("x-forwarded-for", "")
+    for candidate in reversed(forwarded.split(",")):
+        candidate = candidate.strip()
+        if candidate and candidate not in TRUSTED_PROXIES:
+            return candidate
+    return ip
+
+
+ip_buckets = BucketTable(IP_BUCKET_CAPACITY, IP_BUCKET_RATE)
+email_buckets = BucketTable(EMAIL_BUCKET_CAPACITY, EMAIL_BUCKET_RATE)
+
+
+# Вызывается до любой работы с bcrypt. Все проверки O(1) и выполняются в event loop
+# (без блокировок), так что отказ стоит микросекунды
+def admit(ip, email=None):
+    # Очередь хэширования глубокая — отказываем сразу, чтобы не отнимать CPU у чтения каталога
+    shed_depth = hasher.queue_depth * HASH_SHED_RATIO
+    if hasher.pending >= shed_depth:
+        drain_seconds = hasher.pending * HASH_TARGET_MS / 1000 / hasher.pool_size
+        raise AdmissionRejected(503, "Server is busy, try again later", drain_seconds)
+
+    now = time.monotonic()
+    wait = ip_buckets.take(ip, now)
+    if wait:
+        raise AdmissionRejected(429, "Too many requests", wait)
+    if email:
+        wait = email_buckets.take(email.strip().lower(), now)
+        if wait:
+            raise AdmissionRejected(429, "Too many attempts for this account", wait)
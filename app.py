@@ -1,160 +1,279 @@
-from fastapi import FastAPI, HTTPException, Depends
-from sqlalchemy import create_engine, Column, Integer, String
-from sqlalchemy.orm import Session, sessionmaker, declarative_base
-import bcrypt
+import time
+
+# Время начала импорта модуля — для замера холодного старта
+_IMPORT_STARTED = time.perf_counter()
+
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from fastapi import APIRouter, FastAPI, HTTPException, Depends, Query, Request
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.staticfiles import StaticFiles
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from models import User  # Only keep User model
-from schemas import UserBase, UserCreate, UserLogin
-from database import engine, SessionLocal
-from auth import is_admin, get_current_user, create_access_token
-
-# Инициализация FastAPI
-from fastapi import FastAPI
-from models import Base  # Импортируем Base
-from database import engine  # Импортируем engine
-
-app = FastAPI()
-# Указываем FastAPI обслуживать статические файлы из папки static
-app.mount("/static", StaticFiles(directory="static"), name="static")
+from schemas import TokenRefresh, UserBase, UserBatchResponse, UserCreate, UserLogin
+from database import get_async_db, get_async_read_db, AsyncReadSessionLocal, AsyncSessionLocal
+from auth import get_current_user, create_user_access_token, user_cache
+import tokens
+from hashing import hasher, HashQueueFull
+import admission
+from admission import AdmissionRejected
+import catalog
+from http_cache import HTTPCacheMiddleware
+import metrics
+from metrics import MetricsMiddleware
+from coherence import CoherenceMiddleware
+import tracing
+from tracing import TracingMiddleware
+import search
+import images
+from migrations import migrate_once
+
+STATIC_DIR = "static"
+MAX_BATCH_USER_IDS = 500
+
+logger = logging.getLogger("uvicorn.error")
+
+# Все эндпоинты регистрируются на роутере, приложение собирается в create_app()
+router = APIRouter()
+
+
+# Метрики в формате Prometheus
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+# Превью фото пакетов: имя файла содержит хэш исходника, поэтому кэшируем навсегда
+@router.get("/images/{name}", include_in_schema=False)
+async def get_image(name: str):
+    path = images.derivatives.path_for(name)
+    if not images.DERIVATIVE_NAME.match(name) or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Image not found")
+    images.derivatives.touch(name)
+    media_type = images.MEDIA_TYPES[name.rsplit(".", 1)[1]]
+    return FileResponse(path, media_type=media_type, headers={"Cache-Control": images.IMMUTABLE_CACHE_CONTROL})
+
+
+# Очередь хэширования переполнена — быстро отказываем
+async def hash_queue_full_handler(request, exc):
+    return JSONResponse(status_code=503, content={"detail": "Server is busy, try again later"}, headers={"Retry-After": "1"})
+
+
+# Отказ контроля допуска (лимиты или перегрузка bcrypt)
+async def admission_rejected_handler(request, exc):
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail}, headers={"Retry-After": str(exc.retry_after)})
+
+# Пакетное получение пользователей одним запросом: GET /api/users?ids=1,2,3
+@router.get("/api/users", response_model=UserBatchResponse)
+async def get_users(ids: str = Query(..., max_length=8192), db: AsyncSession = Depends(get_async_read_db)):
+    try:
+        user_ids = list(dict.fromkeys(int(part) for part in ids.split(",") if part.strip()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be a comma-separated list of integers")
+    if len(user_ids) > MAX_BATCH_USER_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_USER_IDS} ids per request")
 
-# Создание таблиц в базе данных
-Base.metadata.create_all(bind=engine)
+    # Один запрос по первичному ключу: WHERE id IN (...)
+    users = (await db.scalars(select(User).where(User.id.in_(user_ids)))).all() if user_ids else []
+    found = {user.id: user for user in users}
+    return {"users": found, "missing": [user_id for user_id in user_ids if user_id not in found]}
 
-# Функция для получения сессии
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
 
 # Эндпоинт для получения данных пользователя
-@app.get("/api/users/{user_id}", response_model=UserBase)
-async def get_user(user_id: int, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == user_id).first()
+@router.get("/api/users/{user_id}", response_model=UserBase)
+async def get_user(user_id: int, db: AsyncSession = Depends(get_async_read_db)):
+    user = await db.scalar(select(User).where(User.id == user_id))
     if user:
         return user
     return {"message": "User not found"}
 
 # Регистрация пользователя
-@app.post("/api/register/")
-async def register_user(user: UserCreate, db: Session = Depends(get_db)):
+@router.post("/api/register/")
+async def register_user(request: Request, user: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    admission.admit(admission.client_ip(request), user.email)
+
     # Проверка на существование пользователя с таким email
-    existing_user = db.query(User).filter(User.email == user.email).first()
+    existing_user = await db.scalar(select(User).where(User.email == user.email))
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
 
     # Хэширование пароля
-    hashed_password = bcrypt.hashpw(user.password.encode('utf-8'), bcrypt.gensalt())
+    hashed_password = await hasher.hash(user.password)
     new_user = User(
         name=user.name,
         email=user.email,
-        password=hashed_password.decode('utf-8'),
+        password=hashed_password,
         role=user.role if user.role else "client"
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     return {"message": "User registered successfully", "role": new_user.role}
 
 # Логин пользователя
-@app.post("/api/login/")
-async def login_user(user: UserLogin, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.email == user.email).first()
-    if not db_user or not bcrypt.checkpw(user.password.encode('utf-8'), db_user.password.encode('utf-8')):
+@router.post("/api/login/")
+async def login_user(request: Request, user: UserLogin, db: AsyncSession = Depends(get_async_db)):
+    admission.admit(admission.client_ip(request), user.email)
+
+    db_user = await db.scalar(select(User).where(User.email == user.email))
+    if not db_user or not await hasher.verify(user.password, db_user.password):
         raise HTTPException(status_code=401, detail="Invalid email or password")
 
-    # Генерация токена
-    access_token = create_access_token(data={"user_id": db_user.id})
-    return {"access_token": access_token, "token_type": "bearer"}
+    # Перехэшируем пароль, если его cost устарел
+    if hasher.needs_rehash(db_user.password):
+        db_user.password = await hasher.hash(user.password)
+        await db.commit()
+
+    # Генерация токенов: короткий access и долгоживущий refresh для продления сессии без bcrypt
+    access_token = create_user_access_token(db_user)
+    refresh_token = tokens.issue_refresh_token(db, db_user.id)
+    await db.commit()
+    return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
+
+
+# Обновление access-токена по refresh-токену: один индексированный поиск, без bcrypt
+@router.post("/api/token/refresh")
+async def refresh_access_token(body: TokenRefresh, db: AsyncSession = Depends(get_async_db)):
+    try:
+        db_user, refresh_token = await tokens.rotate_refresh_token(db, body.refresh_token)
+    except tokens.RefreshTokenRaced as e:
+        # Параллельный запрос уже обменял токен — сессия жива, cookie клиент не трогает
+        raise HTTPException(status_code=409, detail=str(e))
+    except tokens.RefreshTokenError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    return {"access_token": create_user_access_token(db_user), "refresh_token": refresh_token, "token_type": "bearer"}
 
 # Получение профиля пользователя
-@app.get("/profile", response_model=UserBase)
+@router.get("/profile", response_model=UserBase)
 async def get_profile(current_user: User = Depends(get_current_user)):
     return current_user
 
 # Редактирование профиля пользователя
-@app.put("/profile", response_model=UserBase)
-async def update_profile(user: UserCreate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.id == current_user.id).first()
+@router.put("/profile", response_model=UserBase)
+async def update_profile(request: Request, user: UserCreate, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    if user.password:
+        admission.admit(admission.client_ip(request), user.email)
+
+    db_user = await db.scalar(select(User).where(User.id == current_user.id))
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
 
     db_user.name = user.name if user.name else db_user.name
     db_user.email = user.email if user.email else db_user.email
     if user.password:
-        db_user.password = bcrypt.hashpw(user.password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-
-    db.commit()
-    db.refresh(db_user)
+        db_user.password = await hasher.hash(user.password)
+        # Смена пароля отзывает ранее выданные токены
+        db_user.token_version += 1
+        await tokens.revoke_user_tokens(db, db_user.id)
+
+    await db.commit()
+    user_cache.invalidate(db_user.id)
+    await db.refresh(db_user)
     return db_user
 
 # Удаление профиля пользователя
-@app.delete("/profile")
-async def delete_profile(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.id == current_user.id).first()
+@router.delete("/profile")
+async def delete_profile(current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    db_user = await db.scalar(select(User).where(User.id == current_user.id))
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    db.delete(db_user)
-    db.commit()
+    await tokens.revoke_user_tokens(db, db_user.id)
+    await db.delete(db_user)
+    await db.commit()
+    user_cache.invalidate(db_user.id)
     return {"message": "Profile deleted successfully"}
 
 
 from typing import List, Optional
-from database import get_db
-from schemas import RenovationPackageCreate, RenovationPackageResponse
+from schemas import AdminPackageResponse, PackageBatchResult, PackageBatchUpdate, RenovationPackageCreate, RenovationPackageResponse, RenovationPackageSearchResult
 from models import RenovationPackage
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Query, Response, status
+
+
 
 
+def decode_cursor_or_400(cursor, sort_by):
+    if cursor is None:
+        return None
+    try:
+        return catalog.decode_cursor(cursor, sort_by)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 
 # Эндпоинт для получения списка пакетов ремонта
-@app.get("/packages/", response_model=List[RenovationPackageResponse])
-def get_packages(
-        db: Session = Depends(get_db),
+@router.get("/packages/", response_model=List[RenovationPackageResponse])
+async def get_packages(
+        db: AsyncSession = Depends(get_async_read_db),
         price_min: Optional[float] = None,
         price_max: Optional[float] = None,
-        sort_by: Optional[str] = "name"  # Сортировка: "name" или "price"
+        sort_by: Optional[str] = "name",  # Сортировка: "name" или "price"
+        limit: int = Query(catalog.DEFAULT_PAGE_SIZE, ge=1, le=catalog.MAX_PAGE_SIZE),
+        cursor: Optional[str] = None  # Курсор следующей страницы из заголовка X-Next-Cursor
 ):
-    query = db.query(RenovationPackage)
-
-    # Фильтрация по минимальной цене
-    if price_min is not None:
-        query = query.filter(RenovationPackage.price >= price_min)
-
-    # Фильтрация по максимальной цене
-    if price_max is not None:
-        query = query.filter(RenovationPackage.price <= price_max)
+    sort_by = "price" if sort_by == "price" else "name"
+    after = decode_cursor_or_400(cursor, sort_by)
 
-    # Сортировка
-    if sort_by == "price":
-        query = query.order_by(RenovationPackage.price)
-    else:
-        query = query.order_by(RenovationPackage.name)
-
-    packages = query.all()
+    # Фильтрация и сортировка по снимку каталога в памяти, без запроса к БД
+    snapshot = await catalog.get_catalog_async(db)
+    packages, next_key = snapshot.query(price_min, price_max, sort_by, after=after, limit=limit)
 
     if not packages:
         raise HTTPException(status_code=404, detail="No renovation packages found")
 
-    return packages
+    headers = {}
+    if next_key is not None:
+        headers["X-Next-Cursor"] = catalog.encode_cursor(sort_by, next_key)
+    # Готовые байты JSON из снимка, минуя повторную валидацию response_model
+    return Response(content=snapshot.encode(packages), media_type="application/json", headers=headers)
+
+
+# Фасеты по цене (гистограмма, min/max/медиана) для боковой панели фильтров.
+# С include_items=true в том же ответе отдается первая страница списка из того же снимка
+@router.get("/packages/facets")
+async def get_package_facets(
+        price_min: Optional[float] = None,
+        price_max: Optional[float] = None,
+        include_items: bool = False,
+        sort_by: Optional[str] = "name",
+        limit: int = Query(catalog.DEFAULT_PAGE_SIZE, ge=1, le=catalog.MAX_PAGE_SIZE),
+        db: AsyncSession = Depends(get_async_read_db)
+):
+    snapshot = await catalog.get_catalog_async(db)
+    result = snapshot.facets(price_min, price_max)
+    if include_items:
+        sort_by = "price" if sort_by == "price" else "name"
+        items, next_key = snapshot.query(price_min, price_max, sort_by, limit=limit)
+        result["items"] = [RenovationPackageResponse(**item) for item in items]
+        result["next_cursor"] = catalog.encode_cursor(sort_by, next_key) if next_key is not None else None
+    return result
+
+
+# Полнотекстовый поиск по названию и описанию (FTS5, ранжирование bm25)
+@router.get("/packages/search", response_model=List[RenovationPackageSearchResult])
+async def search_packages(
+        q: str = Query(..., min_length=1, max_length=200),
+        limit: int = Query(20, ge=1, le=100),
+        db: AsyncSession = Depends(get_async_read_db)
+):
+    return await search.search_packages(db, q, limit)
 
 
-from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
 
 
 
 
 # Эндпоинт для добавления нового пакета ремонта (доступно только администратору)
-@app.post("/packages/", response_model=RenovationPackageResponse)
-def create_package(
+@router.post("/packages/", response_model=RenovationPackageResponse)
+async def create_package(
         package: RenovationPackageCreate,
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_async_db),
         current_user: User = Depends(get_current_user)  # Получение текущего пользователя
 ):
     if current_user.role != "admin":  # Проверка роли
@@ -165,17 +284,19 @@ def create_package(
 
     db_package = RenovationPackage(**package.dict())
     db.add(db_package)
-    db.commit()
-    db.refresh(db_package)
+    await db.commit()
+    catalog.apply_change(upserts=[db_package])
+    images.derivatives.schedule(package.photo_url)
+    await db.refresh(db_package)
     return db_package
 
 
 # Эндпоинт для редактирования пакета ремонта (доступно только администратору)
-@app.put("/packages/{package_id}", response_model=RenovationPackageResponse)
-def update_package(
+@router.put("/packages/{package_id}", response_model=RenovationPackageResponse)
+async def update_package(
         package_id: int,
         package: RenovationPackageCreate,
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_async_db),
         current_user: User = Depends(get_current_user)  # Получение текущего пользователя
 ):
     if current_user.role != "admin":  # Проверка роли
@@ -184,43 +305,47 @@ def update_package(
             detail="Only admins can edit renovation packages"
         )
 
-    db_package = db.query(RenovationPackage).filter(RenovationPackage.id == package_id).first()
+    db_package = await db.scalar(select(RenovationPackage).where(RenovationPackage.id == package_id))
     if not db_package:
         raise HTTPException(status_code=404, detail="Renovation package not found")
 
     db_package.name = package.name
     db_package.description = package.description
     db_package.price = package.price
+    db_package.version += 1
 
-    db.commit()
-    db.refresh(db_package)
+    await db.commit()
+    catalog.apply_change(upserts=[db_package])
+    await db.refresh(db_package)
     return db_package
 
 
-@app.put("/about_page/{package_id}", response_model=RenovationPackageResponse)
-def update_package(
+@router.put("/about_page/{package_id}", response_model=RenovationPackageResponse)
+async def update_package(
         package_id: int,
         package: RenovationPackageCreate,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
-    db_package = db.query(RenovationPackage).filter(RenovationPackage.id == package_id).first()
+    db_package = await db.scalar(select(RenovationPackage).where(RenovationPackage.id == package_id))
     if not db_package:
         raise HTTPException(status_code=404, detail="Renovation package not found")
 
     db_package.name = package.name
     db_package.description = package.description
     db_package.price = package.price
+    db_package.version += 1
 
-    db.commit()
-    db.refresh(db_package)
+    await db.commit()
+    catalog.apply_change(upserts=[db_package])
+    await db.refresh(db_package)
     return db_package
 
 
 # Эндпоинт для удаления пакета ремонта (доступно только администратору)
-@app.delete("/packages/{package_id}")
-def delete_package(
+@router.delete("/packages/{package_id}")
+async def delete_package(
         package_id: int,
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_async_db),
         current_user: User = Depends(get_current_user)  # Получение текущего пользователя
 ):
     if current_user.role != "admin":  # Проверка роли
@@ -229,33 +354,107 @@ def delete_package(
             detail="Only admins can delete renovation packages"
         )
 
-    db_package = db.query(RenovationPackage).filter(RenovationPackage.id == package_id).first()
+    db_package = await db.scalar(select(RenovationPackage).where(RenovationPackage.id == package_id))
     if not db_package:
         raise HTTPException(status_code=404, detail="Renovation package not found")
 
-    db.delete(db_package)
-    db.commit()
+    await db.delete(db_package)
+    await db.commit()
+    catalog.apply_change(deleted_ids=[package_id])
     return {"message": "Renovation package deleted successfully"}
 
 
 
 # Получение всех пакетов для админа
-@app.get("/admin/packages/", response_model=List[RenovationPackageResponse])
-def admin_get_packages(
-        db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_user)
+@router.get("/admin/packages/", response_model=List[AdminPackageResponse])
+async def admin_get_packages(
+        db: AsyncSession = Depends(get_async_read_db),
+        current_user: User = Depends(get_current_user),
+        sort_by: Optional[str] = "name",
+        limit: int = Query(catalog.DEFAULT_PAGE_SIZE, ge=1, le=catalog.MAX_PAGE_SIZE),
+        cursor: Optional[str] = None
 ):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Only admins can access this")
 
-    return db.query(RenovationPackage).all()
+    sort_by = "price" if sort_by == "price" else "name"
+    after = decode_cursor_or_400(cursor, sort_by)
+
+    # Админка читает из БД (а не из снимка), keyset по составному индексу.
+    # Строки-кортежи сразу кодируются в JSON, без ORM и Pydantic
+    rows = (await db.execute(catalog.keyset_select(sort_by, after, limit + 1, with_version=True))).all()
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        headers["X-Next-Cursor"] = catalog.encode_cursor(sort_by, (getattr(last, sort_by), last.id))
+    return Response(content=catalog.encode_rows(rows, with_version=True), media_type="application/json", headers=headers)
+
+
+# Пакетное изменение пакетов (правки и/или переоценка по правилу) в одной транзакции.
+# Каждая правка проверяет версию пакета: при конфликте ничего не применяется, ответ 409
+@router.post("/admin/packages/batch", response_model=PackageBatchResult)
+async def admin_batch_update_packages(
+        batch: PackageBatchUpdate,
+        db: AsyncSession = Depends(get_async_db),
+        current_user: User = Depends(get_current_user)
+):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can update packages")
+
+    import bulk
+
+    try:
+        rows = await bulk.batch_update(db, batch.updates, batch.rule)
+    except bulk.PackagesNotFound as e:
+        raise HTTPException(status_code=404, detail={"message": "Packages not found", "ids": e.package_ids})
+    except bulk.VersionConflict as e:
+        raise HTTPException(status_code=409, detail={"message": "Packages were modified concurrently", "ids": e.package_ids})
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail="Package with this name already exists")
+
+    catalog.apply_change(upserts=rows)
+    return {"updated": [{"id": row["id"], "price": int(row["price"]), "version": row["version"]} for row in rows]}
+
+
+# Потоковый импорт пакетов (NDJSON или CSV) с upsert по названию
+@router.post("/admin/packages/import")
+async def admin_import_packages(
+        request: Request,
+        format: str = Query("ndjson", regex="^(ndjson|csv)$"),
+        db: AsyncSession = Depends(get_async_db),
+        current_user: User = Depends(get_current_user)
+):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can import packages")
+
+    import bulk  # импортируется лениво: нужен только для редких bulk-операций
+
+    report = await bulk.import_packages(db, request.stream(), format)
+    await catalog.refresh_async(db)
+    return report
+
+
+# Потоковый экспорт всех пакетов без загрузки таблицы в память
+@router.get("/admin/packages/export")
+async def admin_export_packages(
+        format: str = Query("ndjson", regex="^(ndjson|csv)$"),
+        current_user: User = Depends(get_current_user)
+):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can export packages")
+
+    import bulk
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(bulk.export_packages(AsyncReadSessionLocal, format), media_type=media_type)
 
 
 # Добавление нового пакета
-@app.post("/admin/packages/", response_model=RenovationPackageResponse)
-def admin_create_package(
+@router.post("/admin/packages/", response_model=RenovationPackageResponse)
+async def admin_create_package(
         package: RenovationPackageCreate,
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_async_db),
         current_user: User = Depends(get_current_user)
 ):
     if current_user.role != "admin":
@@ -263,49 +462,100 @@ def admin_create_package(
 
     new_package = RenovationPackage(**package.dict())
     db.add(new_package)
-    db.commit()
-    db.refresh(new_package)
+    await db.commit()
+    catalog.apply_change(upserts=[new_package])
+    images.derivatives.schedule(package.photo_url)
+    await db.refresh(new_package)
     return new_package
 
 
 # Редактирование пакета
-@app.put("/admin/packages/{package_id}", response_model=RenovationPackageResponse)
-def admin_update_package(
+@router.put("/admin/packages/{package_id}", response_model=RenovationPackageResponse)
+async def admin_update_package(
         package_id: int,
         package: RenovationPackageCreate,
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_async_db),
         current_user: User = Depends(get_current_user)
 ):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Only admins can update packages")
 
-    db_package = db.query(RenovationPackage).filter(RenovationPackage.id == package_id).first()
+    db_package = await db.scalar(select(RenovationPackage).where(RenovationPackage.id == package_id))
     if not db_package:
         raise HTTPException(status_code=404, detail="Package not found")
 
     db_package.name = package.name
     db_package.description = package.description
     db_package.price = package.price
+    db_package.version += 1
 
-    db.commit()
-    db.refresh(db_package)
+    await db.commit()
+    catalog.apply_change(upserts=[db_package])
+    await db.refresh(db_package)
     return db_package
 
 
 # Удаление пакета
-@app.delete("/admin/packages/{package_id}")
-def admin_delete_package(
+@router.delete("/admin/packages/{package_id}")
+async def admin_delete_package(
         package_id: int,
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_async_db),
         current_user: User = Depends(get_current_user)
 ):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Only admins can delete packages")
 
-    db_package = db.query(RenovationPackage).filter(RenovationPackage.id == package_id).first()
+    db_package = await db.scalar(select(RenovationPackage).where(RenovationPackage.id == package_id))
     if not db_package:
         raise HTTPException(status_code=404, detail="Package not found")
 
-    db.delete(db_package)
-    db.commit()
-    return {"message": "Package deleted successfully"}
\ No newline at end of file
+    await db.delete(db_package)
+    await db.commit()
+    catalog.apply_change(deleted_ids=[package_id])
+    return {"message": "Package deleted successfully"}
+
+
+# Старт и остановка воркера: миграции (один раз на все воркеры), калибровка bcrypt
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    await asyncio.to_thread(migrate_once)
+    await asyncio.to_thread(hasher.calibrate)
+    async with AsyncSessionLocal() as db:
+        purged = await tokens.purge_refresh_tokens(db)
+    if purged:
+        logger.info("Startup: purged %d expired or revoked refresh tokens", purged)
+    bootstrap_seconds = time.perf_counter() - started
+    metrics.STARTUP_SECONDS.set("bootstrap", value=bootstrap_seconds)
+    logger.info("Startup: import %.3fs, bootstrap %.3fs", app.state.import_seconds, bootstrap_seconds)
+    yield
+    hasher.shutdown()
+    images.derivatives.shutdown()
+
+
+# Фабрика приложения: без побочных эффектов (DDL, файловая система) во время импорта
+def create_app() -> FastAPI:
+    app = FastAPI(lifespan=lifespan)
+    app.state.import_seconds = time.perf_counter() - _IMPORT_STARTED
+    metrics.STARTUP_SECONDS.set("import", value=app.state.import_seconds)
+
+    app.include_router(router)
+    app.add_exception_handler(HashQueueFull, hash_queue_full_handler)
+    app.add_exception_handler(AdmissionRejected, admission_rejected_handler)
+
+    # ETag/304 и сжатие ответов
+    app.add_middleware(HTTPCacheMiddleware)
+    # Сброс локальных кэшей после записи из других воркеров (снаружи ETag, чтобы версия была свежей)
+    app.add_middleware(CoherenceMiddleware)
+    # Метрики запросов (добавлена последней — внешний слой, учитывает и 304 от кэша)
+    app.add_middleware(MetricsMiddleware)
+    # Трассировка медленных запросов — только если включена (TRACE_SLOW_REQUESTS=1)
+    if tracing.TRACE_ENABLED:
+        app.add_middleware(TracingMiddleware)
+
+    # Указываем FastAPI обслуживать статические файлы из папки static
+    app.mount("/static", StaticFiles(directory=STATIC_DIR, check_dir=False), name="static")
+    return app
+
+
+app = create_app()
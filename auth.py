@@ -1,3 +1,7 @@
+import os
+import threading
+import time
+from collections import OrderedDict
 from jose import jwt, JWTError
 from fastapi import HTTPException, Security, Depends
 from fastapi.security import OAuth2PasswordBearer
@@ -5,14 +9,24 @@ from datetime import datetime, timedelta
 from pydantic import ValidationError
 from starlette import status
 from models import User
-from database import SessionLocal
-import jwt
+from sqlalchemy import select
+from database import AsyncReadSessionLocal, ReadSessionLocal
+import coherence
 
 # Секретный ключ для JWT
 SECRET_KEY = "aitu"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Кэш проверенных токенов для Flask: повторные просмотры страниц не тратят время на криптографию
+TOKEN_CACHE_TTL = 60
+TOKEN_CACHE_SIZE = 10000
+# Как часто перечитывать token_version пользователя (задержка отзыва токена)
+TOKEN_VERSION_TTL = 5
+# Кэш пользователей для FastAPI-зависимости get_current_user
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "30"))
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 # Функция для генерации JWT токена
@@ -23,8 +37,85 @@ def create_access_token(data: dict, expires_delta: timedelta = timedelta(minutes
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-# Функция для получения текущего пользователя из токена
-def get_current_user(token: str = Depends(oauth2_scheme)):
+# Access-токен пользователя: в нем лежат все данные, нужные фронтенду, чтобы проверять его локально
+def create_user_access_token(user):
+    return create_access_token(data={
+        "sub": str(user.id),
+        "name": user.name,
+        "role": user.role,
+        "ver": user.token_version,
+    })
+
+# Пользователь из кэша: неизменяемая копия нужных эндпоинтам полей (без пароля),
+# одна на id для всех запросов
+class CachedUser:
+    __slots__ = ("id", "name", "email", "role", "token_version")
+
+    def __init__(self, id, name, email, role, token_version):
+        self.id = id
+        self.name = name
+        self.email = email
+        self.role = role
+        self.token_version = token_version
+
+
+USER_COLUMNS = [User.id, User.name, User.email, User.role, User.token_version]
+
+
+# LRU-кэш пользователей с TTL: роль и данные профиля без запроса к БД на каждый вызов
+class UserCache:
+    def __init__(self, max_size=USER_CACHE_SIZE, ttl=USER_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._users = OrderedDict()  # user_id -> (CachedUser, годен до)
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._users[user_id]
+                return None
+            self._users.move_to_end(user_id)
+            return entry[0]
+
+    def put(self, user):
+        with self._lock:
+            self._users[user.id] = (user, time.monotonic() + self.ttl)
+            self._users.move_to_end(user.id)
+            while len(self._users) > self.max_size:
+                self._users.popitem(last=False)
+
+    # Вызывается после изменения или удаления пользователя
+    def invalidate(self, user_id):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+
+user_cache = UserCache()
+
+
+async def load_user(user_id: int):
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
+    async with AsyncReadSessionLocal() as db:
+        row = (await db.execute(select(*USER_COLUMNS).where(User.id == user_id))).first()
+    if row is None:
+        return None
+    user = CachedUser(*row)
+    user_cache.put(user)
+    return user
+
+
+# Зависимость FastAPI: текущий пользователь целиком (с ролью). В обычном случае — без запроса к БД
+async def get_current_user(token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_403_FORBIDDEN,
         detail="Could not validate credentials",
@@ -33,15 +124,88 @@ def get_current_user(token: str = Depends(oauth2_scheme)):
     try:
         # Декодируем токен
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
-        return {"id": user_id}  # Возвращаем объект пользователя или ID
-    except (JWTError, ValidationError):
+        user_id = int(payload["sub"])
+    except (JWTError, ValidationError, KeyError, ValueError):
+        raise credentials_exception
+
+    user = await load_user(user_id)
+    # Пользователь удален или токен отозван сменой пароля
+    if user is None or user.token_version != payload.get("ver", 0):
         raise credentials_exception
+    return user
 
 # Функция для проверки, является ли пользователь администратором
 def is_admin(current_user: User = Depends(get_current_user)):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="You don't have enough permissions")
     return current_user
+
+
+_token_cache = {}  # token -> (claims, годен до)
+_version_cache = {}  # user_id -> (token_version или None, годен до)
+_cache_lock = threading.Lock()
+
+
+# Пользователя изменил другой воркер (смена пароля, удаление) — версии токенов перечитываем
+def _clear_user_caches():
+    with _cache_lock:
+        _version_cache.clear()
+    user_cache.clear()
+
+
+coherence.subscribe("users", _clear_user_caches)
+
+
+def _cache_put(cache, key, value, expires_at):
+    with _cache_lock:
+        if len(cache) >= TOKEN_CACHE_SIZE:
+            # Выбрасываем самую старую запись (dict хранит порядок вставки)
+            cache.pop(next(iter(cache)))
+        cache[key] = (value, expires_at)
+
+
+def _cache_get(cache, key, now):
+    entry = cache.get(key)
+    if entry and entry[1] > now:
+        return entry[0], True
+    return None, False
+
+
+def _get_token_version(user_id: int, now: float):
+    version, found = _cache_get(_version_cache, user_id, now)
+    if found:
+        return version
+    db = ReadSessionLocal()
+    try:
+        version = db.query(User.token_version).filter(User.id == user_id).scalar()
+    finally:
+        db.close()
+    _cache_put(_version_cache, user_id, version, now + TOKEN_VERSION_TTL)
+    return version
+
+
+# Локальная проверка токена во Flask (без запроса к FastAPI /profile).
+# Возвращает {"id", "name", "role"} или None, если токен недействителен или отозван
+def verify_access_token(token: str):
+    now = time.time()
+    claims, found = _cache_get(_token_cache, token, now)
+    if not found:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            claims = {"id": int(payload["sub"]), "name": payload.get("name"), "role": payload.get("role"), "ver": payload.get("ver", 0)}
+        except (JWTError, KeyError, ValueError):
+            return None
+        _cache_put(_token_cache, token, claims, min(now + TOKEN_CACHE_TTL, payload["exp"]))
+
+    if _get_token_version(claims["id"], now) != claims["ver"]:
+        return None
+    return claims
+
+
+# Истекает ли access-токен в ближайшие margin секунд (подпись не проверяется —
+# только чтобы решить, пора ли обновлять сессию)
+def access_token_expires_soon(token: str, margin: int) -> bool:
+    try:
+        return jwt.get_unverified_claims(token)["exp"] - time.time() < margin
+    except (JWTError, KeyError, TypeError):
+        return True
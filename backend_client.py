@@ -0,0 +1,144 @@
+import os
+import threading
+import time
+
+import requests
+from flask import has_request_context, request as flask_request
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import tracing
+
+# Адрес FastAPI-бэкенда
+FASTAPI_URL = os.getenv("FASTAPI_URL", "http://127.0.0.1:8000")
+
+# Таймауты (подключение, чтение) в секундах
+CONNECT_TIMEOUT = float(os.getenv("BACKEND_CONNECT_TIMEOUT", "1"))
+READ_TIMEOUT = float(os.getenv("BACKEND_READ_TIMEOUT", "5"))
+POOL_SIZE = int(os.getenv("BACKEND_POOL_SIZE", "20"))
+MAX_RETRIES = int(os.getenv("BACKEND_MAX_RETRIES", "2"))
+USERS_BATCH_SIZE = 500  # совпадает с лимитом GET /api/users на стороне API
+
+# Circuit breaker: после N ошибок подряд перестаем ходить в API на reset_timeout секунд
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BACKEND_BREAKER_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BACKEND_BREAKER_RESET", "10"))
+
+
+class BackendUnavailable(requests.ConnectionError):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    # Можно ли сейчас отправить запрос
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            # Полуоткрытое состояние: пропускаем только один пробный запрос
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class BackendClient:
+    def __init__(self, base_url=FASTAPI_URL, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.breaker = CircuitBreaker()
+        self.session = requests.Session()
+        # Ответы 502-504 и обрывы чтения повторяем только для GET: PUT/DELETE могли уже
+        # выполниться на API. Ошибки соединения (запрос не ушел) urllib3 повторяет для всех методов.
+        # Retry-After не соблюдаем: ожидание заняло бы поток воркера Flask
+        retry = Retry(
+            total=MAX_RETRIES,
+            backoff_factor=0.1,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset({"GET"}),
+            respect_retry_after_header=False,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, method, path, token=None, **kwargs):
+        if not self.breaker.allow():
+            raise BackendUnavailable("Backend API is unavailable")
+
+        headers = kwargs.pop("headers", {})
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        # Адрес пользователя для лимитов API (иначе API видит только адрес фронтенда)
+        if has_request_context() and flask_request.remote_addr:
+            forwarded = flask_request.headers.get("X-Forwarded-For")
+            remote_addr = flask_request.remote_addr
+            headers["X-Forwarded-For"] = f"{forwarded}, {remote_addr}" if forwarded else remote_addr
+        kwargs.setdefault("timeout", self.timeout)
+
+        try:
+            with tracing.span("http", f"{method} {path}"):
+                response = self.session.request(method, f"{self.base_url}{path}", headers=headers, **kwargs)
+        except requests.RequestException:
+            self.breaker.record_failure()
+            raise
+
+        # 503 с Retry-After — контролируемый отказ API под нагрузкой (load shedding),
+        # а не сбой: из-за него нельзя отключать все страницы, которые ходят в API
+        if response.status_code >= 500 and not (response.status_code == 503 and "Retry-After" in response.headers):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request("PUT", path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request("DELETE", path, **kwargs)
+
+    # Пакетный поиск пользователей: один HTTP-запрос на каждые USERS_BATCH_SIZE id.
+    # Возвращает (словарь id -> пользователь, список ненайденных id)
+    def get_users(self, user_ids):
+        users, missing = {}, []
+        for start in range(0, len(user_ids), USERS_BATCH_SIZE):
+            chunk = user_ids[start:start + USERS_BATCH_SIZE]
+            response = self.get("/api/users", params={"ids": ",".join(str(user_id) for user_id in chunk)})
+            response.raise_for_status()
+            data = response.json()
+            users.update({int(user_id): user for user_id, user in data["users"].items()})
+            missing.extend(data["missing"])
+        return users, missing
+
+
+# Общий клиент для всех представлений Flask
+backend = BackendClient()
@@ -0,0 +1,32 @@
+# Замер холодного старта воркера: импорт модуля app и создание приложения в новом процессе.
+# Запуск из корня репозитория: python benchmarks/cold_start.py --runs 10
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = "import app; print(app.app.state.import_seconds)"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    wall, imports = [], []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, "-c", PROBE], cwd=ROOT, check=True, capture_output=True, text=True).stdout
+        wall.append(time.perf_counter() - start)
+        imports.append(float(output.strip().splitlines()[-1]))
+
+    print(f"process wall time: median {statistics.median(wall) * 1000:.1f} ms, max {max(wall) * 1000:.1f} ms")
+    print(f"app module import: median {statistics.median(imports) * 1000:.1f} ms, max {max(imports) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# Сравнение пропускной способности синхронного и асинхронного доступа к БД.
+# Запуск из корня репозитория: python benchmarks/db_throughput.py --requests 2000 --concurrency 50
+import argparse
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select
+
+from database import SessionLocal, AsyncSessionLocal
+from models import RenovationPackage
+
+
+def sync_query():
+    db = SessionLocal()
+    try:
+        return db.query(RenovationPackage).order_by(RenovationPackage.name).all()
+    finally:
+        db.close()
+
+
+async def async_query():
+    async with AsyncSessionLocal() as db:
+        return (await db.scalars(select(RenovationPackage).order_by(RenovationPackage.name))).all()
+
+
+# Старый путь: синхронная сессия прямо в корутине — блокирует event loop
+async def run_sync(total, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            sync_query()
+
+    await asyncio.gather(*(one() for _ in range(total)))
+
+
+# Синхронная сессия в пуле потоков (как FastAPI исполняет обычные def-обработчики)
+async def run_threaded(total, concurrency):
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        await asyncio.gather(*(loop.run_in_executor(executor, sync_query) for _ in range(total)))
+
+
+async def run_async(total, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await async_query()
+
+    await asyncio.gather(*(one() for _ in range(total)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    for name, runner in (("sync", run_sync), ("sync+threads", run_threaded), ("async", run_async)):
+        start = time.perf_counter()
+        asyncio.run(runner(args.requests, args.concurrency))
+        elapsed = time.perf_counter() - start
+        print(f"{name:>14}: {args.requests / elapsed:10.1f} req/s ({elapsed:.2f} s)")
+
+
+if __name__ == "__main__":
+    main()
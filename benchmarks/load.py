@@ -0,0 +1,284 @@
+# Нагрузочный бенчмарк FastAPI (через ASGI-транспорт в процессе) и Flask (через test_client).
+# Запуск из корня репозитория:
+#   python benchmarks/load.py --requests 2000 --concurrency 20 --save       # записать baseline
+#   python benchmarks/load.py --requests 2000 --concurrency 20 --tolerance 0.2  # сравнить с baseline
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Бенчмарк работает с отдельной временной базой, настройки берутся до импорта приложений.
+# DATABASE_URL перезаписываем всегда: сценарии пишут в базу, рабочую трогать нельзя
+_scratch = tempfile.mkdtemp(prefix="truewood-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_scratch, 'bench.db')}"
+os.environ.setdefault("HASH_TARGET_MS", "20")
+# Все запросы бенчмарка идут с одного адреса и по нескольким email — лимиты контроля
+# допуска поднимаем всегда (даже если они заданы в окружении), иначе сценарии логина
+# и регистрации измеряли бы ответы 429
+os.environ["AUTH_IP_BURST"] = "1000000"
+os.environ["AUTH_IP_RATE"] = "1000000"
+os.environ["AUTH_EMAIL_BURST"] = "1000000"
+os.environ["AUTH_EMAIL_RATE"] = "1000000"
+
+import httpx
+
+from app import app
+from hashing import hasher
+from main import flask_app
+from migrations import migrate_once
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+SEED_PACKAGES = 200
+
+
+class Context:
+    def __init__(self):
+        self.counter = 0
+        self.users = []  # (email, password)
+        self.tokens = []
+        self.admin_token = None
+        self.package_ids = []
+
+    def next_id(self):
+        self.counter += 1
+        return self.counter
+
+
+def auth(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+# Сценарии FastAPI: имя -> (вес, корутина)
+async def register(client, ctx):
+    n = ctx.next_id()
+    return await client.post("/api/register/", json={"name": f"bench{n}", "email": f"bench{n}@example.com", "password": "secret"})
+
+
+async def login(client, ctx):
+    email, password = random.choice(ctx.users)
+    return await client.post("/api/login/", json={"email": email, "password": password})
+
+
+async def list_packages(client, ctx):
+    return await client.get("/packages/", params={"sort_by": "price"})
+
+
+async def filter_packages(client, ctx):
+    low = random.randint(0, 5000)
+    return await client.get("/packages/", params={"price_min": low, "price_max": low + 2000, "sort_by": "name"})
+
+
+async def profile(client, ctx):
+    return await client.get("/profile", headers=auth(random.choice(ctx.tokens)))
+
+
+async def admin_crud(client, ctx):
+    n = ctx.next_id()
+    body = {"name": f"bench-package-{n}", "description": "benchmark", "price": random.randint(100, 10000)}
+    response = await client.post("/admin/packages/", json=body, headers=auth(ctx.admin_token))
+    if response.status_code != 200:
+        return response
+    package_id = response.json()["id"]
+    body["price"] += 1
+    await client.put(f"/admin/packages/{package_id}", json=body, headers=auth(ctx.admin_token))
+    return await client.delete(f"/admin/packages/{package_id}", headers=auth(ctx.admin_token))
+
+
+API_SCENARIOS = {
+    "register": (1, register),
+    "login": (2, login),
+    "packages": (10, list_packages),
+    "packages_filtered": (6, filter_packages),
+    "profile": (3, profile),
+    "admin_crud": (1, admin_crud),
+}
+
+# Test client отбрасывает cookie, переданные сырым заголовком Cookie
+def web_profile(client, ctx):
+    client.set_cookie("access_token", random.choice(ctx.tokens))
+    return client.get("/profile_page")
+
+
+# Сценарии Flask: страницы, которые не ходят в API по сети
+WEB_SCENARIOS = {
+    "web_catalog": (10, lambda client, ctx: client.get("/catalog")),
+    "web_about_package": (5, lambda client, ctx: client.get(f"/about_package/{random.choice(ctx.package_ids)}")),
+    "web_profile": (3, web_profile),
+}
+
+
+# Без данных сценарии измеряли бы ошибки вместо работы — падаем сразу
+def check(response, step):
+    if response.status_code != 200:
+        raise SystemExit(f"seed step '{step}' failed: {response.status_code} {response.text[:200]}")
+    return response
+
+
+async def seed(client, ctx):
+    check(await client.post("/api/register/", json={"name": "bench-admin", "email": "admin@example.com", "password": "secret", "role": "admin"}), "register admin")
+    response = check(await client.post("/api/login/", json={"email": "admin@example.com", "password": "secret"}), "login admin")
+    ctx.admin_token = response.json()["access_token"]
+    ctx.tokens.append(ctx.admin_token)
+
+    for i in range(5):
+        email = f"seed{i}@example.com"
+        check(await client.post("/api/register/", json={"name": f"seed{i}", "email": email, "password": "secret"}), f"register {email}")
+        ctx.users.append((email, "secret"))
+        response = check(await client.post("/api/login/", json={"email": email, "password": "secret"}), f"login {email}")
+        ctx.tokens.append(response.json()["access_token"])
+
+    lines = "\n".join(
+        json.dumps({"name": f"seed-package-{i}", "description": f"Seed package {i}", "price": random.randint(100, 10000)})
+        for i in range(SEED_PACKAGES)
+    )
+    check(await client.post("/admin/packages/import", content=lines.encode("utf-8"), headers=auth(ctx.admin_token)), "import packages")
+    response = check(await client.get("/packages/", params={"limit": 500}), "list packages")
+    ctx.package_ids = [p["id"] for p in response.json()]
+    if not ctx.package_ids:
+        raise SystemExit("seed step 'list packages' returned no packages")
+
+
+def pick(scenarios, total):
+    names = list(scenarios)
+    weights = [scenarios[name][0] for name in names]
+    return random.choices(names, weights=weights, k=total)
+
+
+def summarize(samples, elapsed):
+    stats = {}
+    for name, (latencies, errors) in samples.items():
+        latencies.sort()
+        count = len(latencies)
+
+        def percentile(q):
+            return round(latencies[min(count - 1, int(q * count))] * 1000, 3)
+
+        stats[name] = {
+            "count": count,
+            "errors": errors,
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+            "rps": round(count / elapsed, 1),
+        }
+    return stats
+
+
+async def run_api(total, concurrency, ctx):
+    samples = {name: ([], 0) for name in API_SCENARIOS}
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await seed(client, ctx)
+
+        async def one(name):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await API_SCENARIOS[name][1](client, ctx)
+                latencies, errors = samples[name]
+                latencies.append(time.perf_counter() - start)
+                if response.status_code >= 300:
+                    samples[name] = (latencies, errors + 1)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(name) for name in pick(API_SCENARIOS, total)))
+        elapsed = time.perf_counter() - start
+    return summarize({k: v for k, v in samples.items() if v[0]}, elapsed)
+
+
+def run_web(total, concurrency, ctx):
+    samples = {name: ([], 0) for name in WEB_SCENARIOS}
+
+    def one(name):
+        with flask_app.test_client() as client:
+            start = time.perf_counter()
+            response = WEB_SCENARIOS[name][1](client, ctx)
+            latency = time.perf_counter() - start
+        return name, latency, response.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for name, latency, status in executor.map(one, pick(WEB_SCENARIOS, total)):
+            latencies, errors = samples[name]
+            latencies.append(latency)
+            # Редирект на /login — тоже ошибка: страница не отрисовывалась
+            if status >= 300:
+                samples[name] = (latencies, errors + 1)
+    elapsed = time.perf_counter() - start
+    return summarize({k: v for k, v in samples.items() if v[0]}, elapsed)
+
+
+# Регрессия: p95 вырос или пропускная способность упала больше чем на tolerance
+def compare(results, baseline, tolerance):
+    failures = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if current["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            failures.append(f"{name}: p95 {current['p95_ms']} ms > baseline {base['p95_ms']} ms")
+        if current["rps"] < base["rps"] * (1 - tolerance):
+            failures.append(f"{name}: {current['rps']} req/s < baseline {base['rps']} req/s")
+    return failures
+
+
+def print_table(results):
+    print(f"{'scenario':<20}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}")
+    for name, s in sorted(results.items()):
+        print(f"{name:<20}{s['count']:>8}{s['errors']:>8}{s['p50_ms']:>10}{s['p95_ms']:>10}{s['p99_ms']:>10}{s['rps']:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=1000, help="запросов на каждое приложение")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--baseline", default="default", help="имя файла в benchmarks/baselines")
+    parser.add_argument("--save", action="store_true", help="сохранить результат как baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    # ASGI-транспорт не запускает lifespan, поэтому схему и bcrypt готовим сами
+    migrate_once()
+    hasher.calibrate()
+    ctx = Context()
+    results = asyncio.run(run_api(args.requests, args.concurrency, ctx))
+    results.update(run_web(args.requests, args.concurrency, ctx))
+    print_table(results)
+
+    # Ошибки означают, что измерялись не те ответы (500, редиректы на логин и т.п.) —
+    # такой прогон не сравнивается и не сохраняется как baseline
+    errors = [f"{name}: {s['errors']} of {s['count']} requests failed" for name, s in sorted(results.items()) if s["errors"]]
+    for error in errors:
+        print(f"ERROR {error}")
+    if errors:
+        sys.exit(1)
+
+    path = os.path.join(BASELINE_DIR, f"{args.baseline}.json")
+    if args.save:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"baseline saved to {path}")
+        return
+
+    if os.path.exists(path):
+        with open(path) as f:
+            failures = compare(results, json.load(f), args.tolerance)
+        for failure in failures:
+            print(f"REGRESSION {failure}")
+        sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
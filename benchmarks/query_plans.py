@@ -0,0 +1,265 @@
+# Страж планов запросов: EXPLAIN QUERY PLAN и время каждого запроса, который выполняют эндпоинты.
+# Запуск из корня репозитория:
+#   python benchmarks/query_plans.py                                   # временная база 200k/50k и проверка
+#   python benchmarks/query_plans.py --database /tmp/synthetic.db      # база из benchmarks/synthetic_data.py
+#   python benchmarks/query_plans.py --database /tmp/synthetic.db --budget-scale 2 --repeat 50
+# Код возврата 1, если план перешел на полный SCAN / временное B-дерево или медиана вышла за бюджет.
+# Запросы не перечисляются вручную: они перехватываются (before_cursor_execute), пока сценарии
+# benchmarks/load.py и обход остальных эндпоинтов гоняются через ASGI/WSGI-клиенты по копии базы.
+# Поэтому новый запрос или фильтр без индекса сразу попадает в проверку; ручной список
+# правил ниже задает только бюджеты и ожидаемые SCAN
+import argparse
+import asyncio
+import os
+import random
+import re
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_USERS = 200000
+DEFAULT_PACKAGES = 50000
+# Бюджет запроса, для которого нет правила: точечные запросы по индексу укладываются с запасом
+DEFAULT_BUDGET_MS = 5
+CAPTURED_KEYWORDS = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+
+class PlanRule:
+    # pattern — регулярное выражение по тексту SQL (пробелы схлопнуты); allowed_scans — начала
+    # строк плана, для которых SCAN ожидаем (полное чтение каталога, обход индекса по порядку с LIMIT)
+    def __init__(self, name, pattern, budget_ms, allowed_scans=()):
+        self.name = name
+        self.pattern = re.compile(pattern)
+        self.budget_ms = budget_ms
+        self.allowed_scans = allowed_scans
+
+
+NAME_WALK = ("SCAN renovation_packages USING INDEX ix_renovation_packages_name_id",)
+PRICE_WALK = ("SCAN renovation_packages USING COVERING INDEX ix_renovation_packages_price_id",
+              "SCAN renovation_packages USING INDEX ix_renovation_packages_price_id")
+FULL_SCAN = ("SCAN renovation_packages",)
+
+# Первое подходящее правило задает бюджет; запросы без правила проверяются по DEFAULT_BUDGET_MS
+RULES = [
+    # Пользователи: GET /api/users/{id}, GET /api/users?ids=, регистрация и логин, проверка токена
+    PlanRule("users.by_id", r"FROM users WHERE users\.id = \?", 1),
+    PlanRule("users.batch", r"FROM users WHERE users\.id IN \(", 10),
+    PlanRule("users.by_email", r"FROM users WHERE users\.email = \?", 1),
+    # Refresh-токены: ротация и отзыв
+    PlanRule("tokens.by_hash", r"FROM refresh_tokens WHERE refresh_tokens\.token_hash = \?", 1),
+    PlanRule("tokens.revoke_family", r"^UPDATE refresh_tokens SET .* WHERE refresh_tokens\.family_id = \?", 2),
+    PlanRule("tokens.revoke_user", r"^UPDATE refresh_tokens SET .* WHERE refresh_tokens\.user_id = \?", 2),
+    # Пакеты: правка и удаление по id
+    PlanRule("packages.by_id", r"renovation_packages WHERE renovation_packages\.id = \?", 1),
+    # Админка: keyset-пагинация по составным индексам
+    PlanRule("admin.keyset_name_first", r"FROM renovation_packages ORDER BY renovation_packages\.name, renovation_packages\.id", 5, NAME_WALK),
+    PlanRule("admin.keyset_name_after", r"WHERE \(renovation_packages\.name, renovation_packages\.id\) >", 5),
+    PlanRule("admin.keyset_price_first", r"FROM renovation_packages ORDER BY renovation_packages\.price, renovation_packages\.id", 5, PRICE_WALK),
+    PlanRule("admin.keyset_price_after", r"WHERE \(renovation_packages\.price, renovation_packages\.id\) >", 5),
+    # Полнотекстовый поиск
+    PlanRule("packages.search", r"renovation_packages_fts MATCH", 100),
+    # Пакетные изменения: правка с проверкой версии, переоценка диапазона цен, импорт
+    PlanRule("batch.patch", r"^UPDATE renovation_packages SET .* WHERE renovation_packages\.id = \? AND renovation_packages\.version = \?", 2),
+    PlanRule("batch.reprice", r"^UPDATE renovation_packages SET .* WHERE renovation_packages\.price >= \?", 100),
+    PlanRule("import.upsert", r"^INSERT INTO renovation_packages .* ON CONFLICT", 5),
+    # Полное чтение ожидаемо: снимок каталога и экспорт. Бюджет — для ~300k пакетов
+    PlanRule("catalog.snapshot_load", r"^SELECT [^()]* FROM renovation_packages$", 3000, FULL_SCAN),
+    PlanRule("export.all", r"^SELECT [^()]* FROM renovation_packages ORDER BY renovation_packages\.id$", 3000, FULL_SCAN),
+]
+
+
+def find_rule(sql):
+    for rule in RULES:
+        if rule.pattern.search(sql):
+            return rule
+    return None
+
+
+def normalize_sql(sql):
+    return " ".join(sql.split())
+
+
+# IN (...) разной длины и VALUES пачек импорта — один и тот же запрос
+def statement_key(sql):
+    return re.sub(r"\?(?:, \?)+", "?", sql)
+
+
+def is_write(sql):
+    return sql.split(" ", 1)[0].upper() in ("INSERT", "UPDATE", "DELETE")
+
+
+# Старые версии SQLite пишут "SCAN TABLE x", новые — "SCAN x"
+def _normalize(detail):
+    return re.sub(r"^(SCAN|SEARCH) TABLE ", r"\1 ", detail)
+
+
+def explain(conn, sql, params):
+    return [_normalize(row[3]) for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def plan_problems(plan, allowed_scans):
+    problems = []
+    for detail in plan:
+        if any(detail.startswith(allowed) for allowed in allowed_scans):
+            continue
+        # Виртуальная таблица FTS5 "сканируется" по своему индексу — это не полный проход
+        if detail.startswith("SCAN ") and "VIRTUAL TABLE" not in detail:
+            problems.append(detail)
+        elif detail.startswith("USE TEMP B-TREE"):
+            problems.append(detail)
+    return problems
+
+
+def measure(conn, sql, params, repeat, write):
+    timings = []
+    # Первый прогон прогревает кэш страниц и не учитывается
+    for i in range(repeat + 1):
+        started = time.perf_counter()
+        if write:
+            conn.execute("BEGIN")
+            try:
+                conn.execute(sql, params).fetchall()
+            finally:
+                conn.execute("ROLLBACK")
+        else:
+            conn.execute(sql, params).fetchall()
+        if i:
+            timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+# Эндпоинты, которых нет в сценариях load.py: поиск, фасеты, админка, пакетные правки,
+# экспорт, ротация refresh-токенов и удаление профиля
+async def cover_api(ctx):
+    import httpx
+
+    import load
+    from app import app
+
+    admin = load.auth(ctx.admin_token)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://plans") as client:
+        user_id = load.check(await client.get("/profile", headers=admin), "profile").json()["id"]
+        load.check(await client.get(f"/api/users/{user_id}"), "user by id")
+        load.check(await client.get("/api/users", params={"ids": ",".join(str(user_id + i) for i in range(50))}), "users batch")
+        load.check(await client.get("/packages/search", params={"q": "ремонт кухни"}), "search")
+        load.check(await client.get("/packages/facets", params={"include_items": "true"}), "facets")
+
+        for sort_by in ("name", "price"):
+            response = load.check(await client.get("/admin/packages/", params={"sort_by": sort_by}, headers=admin), f"admin {sort_by}")
+            cursor = response.headers.get("X-Next-Cursor")
+            if cursor:
+                load.check(await client.get("/admin/packages/", params={"sort_by": sort_by, "cursor": cursor}, headers=admin), f"admin {sort_by} next")
+
+        package = response.json()[0]
+        batch = {
+            "updates": [{"id": package["id"], "version": package["version"], "price": package["price"] + 100}],
+            "rule": {"percent": 7, "price_min": package["price"], "price_max": package["price"] + 500},
+        }
+        load.check(await client.post("/admin/packages/batch", json=batch, headers=admin), "batch update")
+        load.check(await client.get("/admin/packages/export", headers=admin), "export")
+
+        email = "plans@example.com"
+        load.check(await client.post("/api/register/", json={"name": "plans", "email": email, "password": "secret"}), "register")
+        tokens = load.check(await client.post("/api/login/", json={"email": email, "password": "secret"}), "login").json()
+        rotated = load.check(await client.post("/api/token/refresh", json={"refresh_token": tokens["refresh_token"]}), "refresh").json()
+        # Повторный обмен того же токена — ветка повторного использования (ответ 401 ожидаем)
+        await client.post("/api/token/refresh", json={"refresh_token": tokens["refresh_token"]})
+        load.check(await client.delete("/profile", headers=load.auth(rotated["access_token"])), "delete profile")
+
+
+def cover_web(ctx):
+    from main import flask_app
+
+    with flask_app.test_client() as client:
+        client.set_cookie("access_token", ctx.admin_token)
+        for path in ("/admin/catalog", "/admin/packages"):
+            client.get(path)
+
+
+# Прогон сценариев с перехватом SQL: текст запроса -> (SQL, параметры первого выполнения)
+def capture(requests):
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    import load
+    from hashing import hasher
+
+    captured = {}
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        sql = normalize_sql(statement)
+        if sql.split(" ", 1)[0].upper() not in CAPTURED_KEYWORDS:
+            return
+        if executemany:
+            parameters = parameters[0] if parameters else ()
+        captured.setdefault(statement_key(sql), (sql, tuple(parameters or ())))
+
+    random.seed(1)
+    hasher.calibrate()
+    ctx = load.Context()
+    event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        asyncio.run(load.run_api(requests, 1, ctx))
+        asyncio.run(cover_api(ctx))
+        load.run_web(requests, 1, ctx)
+        cover_web(ctx)
+    finally:
+        event.remove(Engine, "before_cursor_execute", before_cursor_execute)
+    return list(captured.values())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database", help="база из synthetic_data.py (по умолчанию генерируется временная)")
+    parser.add_argument("--requests", type=int, default=200, help="запросов сценариев load.py на каждое приложение")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--budget-scale", type=float, default=1.0, help="множитель бюджетов (медленная машина CI)")
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix="truewood-plans-")
+    path = args.database or os.path.join(scratch, "synthetic.db")
+    # Сценарии пишут в базу, поэтому приложения работают с копией, а планы и время
+    # снимаются на исходной. Модули приложения создают движки при импорте — адрес задаем заранее
+    capture_path = os.path.join(scratch, "capture.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{capture_path}"
+    os.environ["SKIP_MIGRATIONS"] = "1"
+    if args.database is None:
+        import synthetic_data
+
+        print(f"generating {DEFAULT_USERS} users / {DEFAULT_PACKAGES} packages in {path}")
+        synthetic_data.generate(path, DEFAULT_USERS, DEFAULT_PACKAGES)
+    shutil.copyfile(path, capture_path)
+
+    statements = capture(args.requests)
+    print(f"captured {len(statements)} distinct statements")
+
+    conn = sqlite3.connect(path, isolation_level=None)
+    failures = 0
+    try:
+        for sql, params in statements:
+            rule = find_rule(sql)
+            name = rule.name if rule else "-"
+            plan = explain(conn, sql, params)
+            problems = plan_problems(plan, rule.allowed_scans if rule else ())
+            elapsed = measure(conn, sql, params, args.repeat, is_write(sql))
+            budget = (rule.budget_ms if rule else DEFAULT_BUDGET_MS) * args.budget_scale
+            ok = not problems and elapsed <= budget
+            failures += not ok
+            print(f"{'ok' if ok else 'FAIL':>4}  {name:<26} {elapsed:9.3f} ms  (budget {budget:g} ms)  {sql[:100]}")
+            for detail in plan:
+                print(f"{'!!' if detail in problems else '':>10}  {detail}")
+    finally:
+        conn.close()
+
+    print(f"{failures} failed" if failures else "all query plans ok")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# Стоимость сериализации одного пакета: ORM + Pydantic response_model + json против
+# быстрого пути (кортежи Core + orjson) и закодированных заранее элементов снимка.
+# Запуск из корня репозитория: python benchmarks/serialization.py --rows 5000
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+
+import catalog
+from models import RenovationPackage
+from schemas import RenovationPackageResponse
+
+
+def make_rows(count):
+    return [
+        (i, f"Package {i}", f"Описание пакета ремонта номер {i} " * 4, float(1000 + i * 7), f"/static/p{i}.jpg", None)
+        for i in range(1, count + 1)
+    ]
+
+
+# Как сейчас отвечает FastAPI: ORM-объекты -> валидация response_model -> jsonable_encoder -> json
+def pydantic_path(rows):
+    objects = [RenovationPackage(**dict(zip(catalog.PACKAGE_FIELDS, row))) for row in rows]
+    models = [RenovationPackageResponse.from_orm(obj) if hasattr(RenovationPackageResponse, "from_orm")
+              else RenovationPackageResponse.model_validate(obj) for obj in objects]
+    content = jsonable_encoder(models)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def fast_path(rows):
+    return catalog.encode_rows(rows)
+
+
+def snapshot_path(snapshot, packages):
+    return snapshot.encode(packages)
+
+
+def measure(func, *args, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=5000)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    snapshot = catalog.CatalogSnapshot.build(1, [dict(zip(catalog.PACKAGE_FIELDS, row)) for row in rows])
+    packages = list(snapshot.by_id.values())
+    snapshot.encode(packages)  # прогрев: элементы кодируются один раз на версию снимка
+
+    slow, expected = measure(pydantic_path, rows)
+    fast, fast_body = measure(fast_path, rows)
+    cached, cached_body = measure(snapshot_path, snapshot, packages)
+
+    # Быстрые пути обязаны давать байт-в-байт тот же ответ
+    assert json.loads(fast_body) == json.loads(expected) and fast_body == expected, "fast path output differs"
+    assert cached_body == expected, "snapshot output differs"
+
+    for name, seconds in (("orm+pydantic", slow), ("core+orjson", fast), ("snapshot cache", cached)):
+        print(f"{name:>15}: {seconds / args.rows * 1e6:8.2f} µs/row  ({slow / seconds:5.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+# Генератор большой синтетической базы для проверки планов запросов и нагрузочных тестов.
+# Запуск из корня репозитория:
+#   python benchmarks/synthetic_data.py --database /tmp/synthetic.db --users 2000000 --packages 300000
+# Пароль у всех пользователей — "password" (один общий хэш: bcrypt на миллионы строк занял бы часы)
+import argparse
+import hashlib
+import math
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+INSERT_CHUNK = 50000
+PASSWORD = "password"
+
+FIRST_NAMES = [
+    "alexander", "maria", "dmitry", "anna", "sergey", "elena", "ivan", "olga", "aidar", "aigerim",
+    "nursultan", "dana", "timur", "aliya", "artem", "sofia", "maxim", "daria", "arman", "madina",
+]
+LAST_NAMES = [
+    "ivanov", "petrova", "smirnov", "kuznetsova", "popov", "sokolova", "akhmetov", "nurlanova",
+    "bekov", "omarova", "volkov", "lebedeva", "kim", "tsoi", "abenov", "zhaksylykova",
+]
+# Почтовые домены с неравномерной популярностью (как в реальных базах)
+EMAIL_DOMAINS = ["gmail.com", "mail.ru", "yandex.kz", "outlook.com", "inbox.ru", "truewood.kz"]
+EMAIL_DOMAIN_WEIGHTS = [50, 25, 10, 8, 6, 1]
+
+ROOMS = ["кухни", "ванной", "спальни", "гостиной", "детской", "прихожей", "балкона", "офиса", "санузла", "кабинета"]
+STYLES = ["Косметический", "Капитальный", "Дизайнерский", "Евро", "Черновой", "Премиум", "Эконом", "Скандинавский", "Лофт"]
+WORDS = (
+    "демонтаж штукатурка шпаклевка покраска обои ламинат паркет плитка керамогранит стяжка "
+    "электрика сантехника вентиляция потолок натяжной гипсокартон утепление гидроизоляция "
+    "дверь окно подоконник откос плинтус розетка освещение смеситель душевая кабина ванна "
+    "гарантия смета материалы вывоз мусора уборка срок бригада дизайн проект замер"
+).split()
+
+
+def _password_hash():
+    import bcrypt
+
+    from hashing import BCRYPT_MIN_ROUNDS
+
+    return bcrypt.hashpw(PASSWORD.encode("utf-8"), bcrypt.gensalt(BCRYPT_MIN_ROUNDS)).decode("utf-8")
+
+
+def iter_users(rng, count, password_hash):
+    for i in range(1, count + 1):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        # Администраторов — доли процента; token_version у большинства 0 (пароль не меняли)
+        role = "admin" if rng.random() < 0.001 else "client"
+        token_version = min(int(rng.expovariate(3.0)), 20)
+        yield (i, f"{first.title()} {last.title()} {i}", f"{first}.{last}.{i}@{rng.choices(EMAIL_DOMAINS, EMAIL_DOMAIN_WEIGHTS)[0]}", password_hash, role, token_version)
+
+
+def iter_packages(rng, count):
+    for i in range(1, count + 1):
+        name = f"{rng.choice(STYLES)} ремонт {rng.choice(ROOMS)} №{i}"
+        description = " ".join(rng.choices(WORDS, k=rng.randint(20, 120))).capitalize() + "."
+        # Цены логнормальные (длинный хвост дорогих пакетов), округлены до сотен; часть — "круглые"
+        price = max(500, int(rng.lognormvariate(math.log(15000), 0.9)) // 100 * 100)
+        if rng.random() < 0.05:
+            price = round(price, -4) or 10000
+        photo_url = f"/static/photos/package_{i}.jpg" if rng.random() < 0.85 else None
+        video_url = f"https://video.truewood.kz/{i}" if rng.random() < 0.2 else None
+        version = min(int(rng.expovariate(1.5)), 10)
+        yield (i, name, description, price, photo_url, video_url, version)
+
+
+def iter_refresh_tokens(rng, user_count, share):
+    now = datetime.utcnow()
+    token_id = 0
+    for user_id in rng.sample(range(1, user_count + 1), int(user_count * share)):
+        # Цепочка ротации: все токены, кроме последнего, уже обменены
+        family_id = f"{rng.getrandbits(128):032x}"
+        length = rng.randint(1, 3)
+        for n in range(length):
+            token_id += 1
+            issued = now - timedelta(days=rng.uniform(0, 30))
+            token_hash = hashlib.sha256(f"{family_id}:{n}".encode("utf-8")).hexdigest()
+            used_at = str(issued + timedelta(hours=1)) if n < length - 1 else None
+            # Даты в том же текстовом формате, в котором их хранит SQLAlchemy
+            yield (token_id, user_id, token_hash, family_id, str(issued + timedelta(days=30)), used_at, rng.random() < 0.05)
+
+
+def _insert(conn, sql, rows):
+    total = 0
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= INSERT_CHUNK:
+            with conn:
+                conn.executemany(sql, chunk)
+            total += len(chunk)
+            chunk.clear()
+    if chunk:
+        with conn:
+            conn.executemany(sql, chunk)
+        total += len(chunk)
+    return total
+
+
+def generate(path, users, packages, refresh_share=0.3, seed=42):
+    from sqlalchemy import create_engine
+
+    from migrations import migrate
+
+    if os.path.exists(path):
+        raise SystemExit(f"{path} already exists, choose a new path")
+    # Схема — та же, что у приложения (модели + DDL миграций: FTS, триггеры, индексы)
+    engine = create_engine(f"sqlite:///{path}")
+    migrate(engine)
+    engine.dispose()
+
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    # База одноразовая: долговечность записи не нужна
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA cache_size = -262144")
+    try:
+        timings = {}
+        started = time.perf_counter()
+        _insert(
+            conn,
+            "INSERT INTO users (id, name, email, password, role, token_version) VALUES (?, ?, ?, ?, ?, ?)",
+            iter_users(rng, users, _password_hash()),
+        )
+        timings["users"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        _insert(
+            conn,
+            "INSERT INTO renovation_packages (id, name, description, price, photo_url, video_url, version) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            iter_packages(rng, packages),
+        )
+        timings["packages"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        _insert(
+            conn,
+            "INSERT INTO refresh_tokens (id, user_id, token_hash, family_id, expires_at, used_at, revoked) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            iter_refresh_tokens(rng, users, refresh_share),
+        )
+        timings["refresh_tokens"] = time.perf_counter() - started
+
+        # Статистика для планировщика, как на боевой базе после ANALYZE
+        started = time.perf_counter()
+        conn.execute("ANALYZE")
+        conn.commit()
+        timings["analyze"] = time.perf_counter() - started
+    finally:
+        conn.close()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database", required=True, help="путь к новому файлу SQLite")
+    parser.add_argument("--users", type=int, default=2000000)
+    parser.add_argument("--packages", type=int, default=300000)
+    parser.add_argument("--refresh-share", type=float, default=0.3, help="доля пользователей с refresh-токенами")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    timings = generate(args.database, args.users, args.packages, args.refresh_share, args.seed)
+    for name, seconds in timings.items():
+        print(f"{name:>15}: {seconds:8.2f} s")
+    print(f"{'size':>15}: {os.path.getsize(args.database) / 1024 / 1024:8.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+import csv
+import io
+import json
+
+from pydantic import ValidationError
+from sqlalchemy import Integer, cast, func, select, update
+from sqlalchemy.dialects.sqlite import insert
+
+from models import RenovationPackage
+from schemas import RenovationPackageCreate
+
+IMPORT_BATCH_SIZE = 500
+EXPORT_BATCH_SIZE = 500
+MAX_REPORTED_ERRORS = 1000
+EXPORT_FIELDS = ["id", "name", "description", "price", "photo_url", "video_url"]
+IMPORT_FIELDS = ["name", "description", "price", "photo_url", "video_url"]
+
+_table = RenovationPackage.__table__
+BATCH_RETURNING = [_table.c[field] for field in EXPORT_FIELDS] + [_table.c.version]
+
+
+class VersionConflict(Exception):
+    def __init__(self, package_ids):
+        self.package_ids = package_ids
+
+
+# Правка ссылается на несуществующий пакет: повтор с новой версией не поможет
+class PackagesNotFound(Exception):
+    def __init__(self, package_ids):
+        self.package_ids = package_ids
+
+# Upsert по уникальному названию: существующий пакет обновляется
+UPSERT = insert(_table).on_conflict_do_update(
+    index_elements=[_table.c.name],
+    # Версия растет, как при любой правке: иначе пакетная правка, сделанная по версии
+    # до импорта, прошла бы проверку и затерла импортированные данные
+    set_={
+        **{field: insert(_table).excluded[field] for field in IMPORT_FIELDS if field != "name"},
+        "version": _table.c.version + 1,
+    },
+)
+
+
+# Читаем тело запроса по кускам и отдаем строки, не держа весь файл в памяти
+async def iter_lines(stream):
+    buffer = b""
+    async for chunk in stream:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8")
+    if buffer:
+        yield buffer.decode("utf-8")
+
+
+# Одна запись CSV может занимать несколько строк (перенос внутри кавычек)
+async def iter_csv_records(lines):
+    header = None
+    pending = ""
+    line_no = 0
+    async for line in lines:
+        line_no += 1
+        pending = f"{pending}\n{line}" if pending else line
+        if pending.count('"') % 2:
+            continue
+        record, pending = next(csv.reader(io.StringIO(pending))), ""
+        if header is None:
+            header = [column.strip() for column in record]
+            continue
+        yield line_no, dict(zip(header, record))
+
+
+async def iter_ndjson_records(lines):
+    line_no = 0
+    async for line in lines:
+        line_no += 1
+        if line.strip():
+            yield line_no, line
+
+
+def validate(raw):
+    if isinstance(raw, str):
+        raw = json.loads(raw)
+    else:
+        # В CSV пустая ячейка означает отсутствие значения
+        raw = {key: (value if value != "" else None) for key, value in raw.items()}
+    return RenovationPackageCreate(**raw).dict()
+
+
+async def import_packages(db, stream, fmt):
+    lines = iter_lines(stream)
+    records = iter_csv_records(lines) if fmt == "csv" else iter_ndjson_records(lines)
+    imported = 0
+    error_count = 0
+    errors = []
+    batch = []
+
+    async def flush():
+        nonlocal imported
+        # Каждая пачка — одна транзакция с executemany
+        await db.execute(UPSERT, batch)
+        await db.commit()
+        imported += len(batch)
+        batch.clear()
+
+    async for line_no, raw in records:
+        try:
+            batch.append(validate(raw))
+        except (ValidationError, ValueError, TypeError) as e:
+            error_count += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({"line": line_no, "error": str(e)})
+            continue
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            await flush()
+    if batch:
+        await flush()
+
+    return {"imported": imported, "failed": error_count, "errors": errors}
+
+
+# Экспорт читает таблицу серверным курсором по частям
+async def export_packages(session_factory, fmt):
+    async with session_factory() as db:
+        columns = [_table.c[field] for field in EXPORT_FIELDS]
+        result = await db.stream(select(*columns).order_by(_table.c.id).execution_options(yield_per=EXPORT_BATCH_SIZE))
+
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(EXPORT_FIELDS)
+            async for rows in result.partitions(EXPORT_BATCH_SIZE):
+                writer.writerows(rows)
+                yield buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate()
+            if buffer.tell():
+                yield buffer.getvalue().encode("utf-8")
+        else:
+            async for rows in result.partitions(EXPORT_BATCH_SIZE):
+                yield "".join(json.dumps(dict(zip(EXPORT_FIELDS, row)), ensure_ascii=False) + "\n" for row in rows).encode("utf-8")
+
+
+# UPDATE одной правки: применяется, только если версия пакета не изменилась
+def patch_statement(patch):
+    values = patch.dict(exclude_unset=True, exclude={"id", "version"})
+    return (
+        update(_table)
+        .where(_table.c.id == patch.id, _table.c.version == patch.version)
+        .values(**values, version=_table.c.version + 1)
+        .returning(*BATCH_RETURNING)
+    )
+
+
+# Set-based UPDATE переоценки: диапазон цен выбирается по индексу (price, id)
+def reprice_statement(rule):
+    statement = update(_table).values(
+        price=cast(func.round(_table.c.price * (1 + rule.percent / 100)), Integer),
+        version=_table.c.version + 1,
+    )
+    if rule.price_min is not None:
+        statement = statement.where(_table.c.price >= rule.price_min)
+    if rule.price_max is not None:
+        statement = statement.where(_table.c.price <= rule.price_max)
+    return statement.returning(*BATCH_RETURNING)
+
+
+# Пакетное изменение в одной транзакции: каждая правка — один UPDATE с проверкой версии,
+# правило переоценки — один set-based UPDATE на весь диапазон цен.
+# Если хоть одна версия не совпала, откатывается все и поднимается VersionConflict,
+# если какого-то пакета нет — PackagesNotFound
+async def batch_update(db, updates=(), rule=None):
+    changed = {}
+    conflicts = []
+    try:
+        for patch in updates:
+            row = (await db.execute(patch_statement(patch))).first()
+            if row is None:
+                conflicts.append(patch.id)
+            else:
+                changed[row.id] = row
+
+        if conflicts:
+            existing = set((await db.scalars(select(_table.c.id).where(_table.c.id.in_(conflicts)))).all())
+            missing = [package_id for package_id in conflicts if package_id not in existing]
+            if missing:
+                raise PackagesNotFound(missing)
+            raise VersionConflict(conflicts)
+
+        if rule is not None:
+            for row in (await db.execute(reprice_statement(rule))).all():
+                changed[row.id] = row
+
+        await db.commit()
+    except BaseException:
+        await db.rollback()
+        raise
+
+    return [row._asdict() for row in changed.values()]
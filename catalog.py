@@ -0,0 +1,312 @@
+import base64
+import json
+import os
+import threading
+from bisect import bisect_left, bisect_right
+
+from sqlalchemy import select, tuple_
+
+from database import ReadSessionLocal
+from models import RenovationPackage
+import fastjson
+import coherence
+import tracing
+
+PACKAGE_FIELDS = ("id", "name", "description", "price", "photo_url", "video_url")
+PACKAGE_COLUMNS = [RenovationPackage.__table__.c[field] for field in PACKAGE_FIELDS]
+# Порядок полей как в RenovationPackageResponse (сначала поля базовой схемы, затем id)
+RESPONSE_FIELDS = ("name", "description", "price", "photo_url", "video_url", "id")
+
+DEFAULT_PAGE_SIZE = 100
+
+# Границы ценовых диапазонов для фасетов (последний диапазон открыт сверху)
+PRICE_BAND_EDGES = [float(edge) for edge in os.getenv("PRICE_BAND_EDGES", "0,1000,5000,10000,50000,100000").split(",")]
+MAX_PAGE_SIZE = 500
+
+
+# Непрозрачный курсор: base64 от [sort_by, значение, id] последнего элемента страницы
+def encode_cursor(sort_by, key):
+    raw = json.dumps([sort_by, key[0], key[1]], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor, sort_by):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort, value, package_id = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if cursor_sort != sort_by or not _is_int(package_id):
+        raise ValueError("Invalid cursor")
+    # Значение сравнивается с колонкой сортировки: число для цены, строка для названия
+    if sort_by == "price" and not (_is_int(value) or isinstance(value, float)):
+        raise ValueError("Invalid cursor")
+    if sort_by == "name" and not isinstance(value, str):
+        raise ValueError("Invalid cursor")
+    return value, package_id
+
+
+# bool в JSON (true/false) — подкласс int, но ключом курсора быть не может
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+# Пакет в том виде, в каком его отдает RenovationPackageResponse (price: int)
+def response_row(package):
+    row = {field: package[field] for field in RESPONSE_FIELDS}
+    row["price"] = int(row["price"])
+    return row
+
+
+# Готовый JSON-ответ для списка пакетов без ORM и без валидации Pydantic.
+# with_version — для админки: версия нужна для оптимистичных блокировок при правке
+def encode_rows(rows, with_version=False):
+    if not with_version:
+        return fastjson.dumps([response_row(dict(zip(PACKAGE_FIELDS, row))) for row in rows])
+    items = []
+    for row in rows:
+        item = response_row(dict(zip(PACKAGE_FIELDS, row)))
+        item["version"] = row.version
+        items.append(item)
+    return fastjson.dumps(items)
+
+
+# Keyset-пагинация в SQL, использует составные индексы (name, id) и (price, id).
+# Выбираются только колонки (Core), без загрузки ORM-объектов
+def keyset_select(sort_by, after=None, limit=DEFAULT_PAGE_SIZE, with_version=False):
+    column = RenovationPackage.price if sort_by == "price" else RenovationPackage.name
+    query = select(*PACKAGE_COLUMNS, RenovationPackage.version) if with_version else select(*PACKAGE_COLUMNS)
+    if after is not None:
+        query = query.where(tuple_(column, RenovationPackage.id) > tuple_(*after))
+    return query.order_by(column, RenovationPackage.id).limit(limit)
+
+
+class CatalogSnapshot:
+    # Неизменяемый снимок каталога: пакеты отсортированы по имени и по цене,
+    # по ценам строится индекс для bisect
+    __slots__ = ("version", "by_name", "by_price", "prices", "name_keys", "price_keys", "by_id", "encoded")
+
+    def __init__(self, version, by_name, by_price, by_id, encoded=None):
+        self.version = version
+        self.by_name = tuple(by_name)
+        self.by_price = tuple(by_price)
+        self.prices = [p["price"] for p in self.by_price]
+        self.name_keys = [(p["name"], p["id"]) for p in self.by_name]
+        self.price_keys = [(p["price"], p["id"]) for p in self.by_price]
+        self.by_id = by_id
+        # Закодированный JSON каждого пакета: пакеты в снимке неизменяемы, кодируем один раз
+        self.encoded = encoded if encoded is not None else {}
+
+    @classmethod
+    def build(cls, version, packages):
+        by_name = sorted(packages, key=lambda p: (p["name"], p["id"]))
+        by_price = sorted(packages, key=lambda p: (p["price"], p["id"]))
+        return cls(version, by_name, by_price, {p["id"]: p for p in packages})
+
+    # Новый снимок с изменениями без перечитывания таблицы: вставки и удаления через bisect
+    def apply(self, version, upserts=(), deleted_ids=()):
+        by_name, name_keys = list(self.by_name), list(self.name_keys)
+        by_price, price_keys = list(self.by_price), list(self.price_keys)
+        by_id = dict(self.by_id)
+        changed = set(deleted_ids) | {package["id"] for package in upserts}
+        encoded = {package_id: data for package_id, data in self.encoded.items() if package_id not in changed}
+
+        def remove(old):
+            i = bisect_left(name_keys, (old["name"], old["id"]))
+            del by_name[i], name_keys[i]
+            i = bisect_left(price_keys, (old["price"], old["id"]))
+            del by_price[i], price_keys[i]
+
+        for package_id in deleted_ids:
+            old = by_id.pop(package_id, None)
+            if old is not None:
+                remove(old)
+        for package in upserts:
+            old = by_id.get(package["id"])
+            if old is not None:
+                remove(old)
+            key = (package["name"], package["id"])
+            i = bisect_left(name_keys, key)
+            name_keys.insert(i, key)
+            by_name.insert(i, package)
+            key = (package["price"], package["id"])
+            i = bisect_left(price_keys, key)
+            price_keys.insert(i, key)
+            by_price.insert(i, package)
+            by_id[package["id"]] = package
+        return CatalogSnapshot(version, by_name, by_price, by_id, encoded)
+
+    # JSON-массив пакетов в байтах: склейка заранее закодированных элементов
+    def encode(self, packages):
+        encoded = self.encoded
+        parts = []
+        for package in packages:
+            data = encoded.get(package["id"])
+            if data is None:
+                data = encoded[package["id"]] = fastjson.dumps(response_row(package))
+            parts.append(data)
+        return b"[" + b",".join(parts) + b"]"
+
+    # Фасеты по цене для диапазона [price_min, price_max]: все считается по
+    # отсортированному списку цен через bisect, без прохода по пакетам
+    def facets(self, price_min=None, price_max=None, edges=None):
+        edges = PRICE_BAND_EDGES if edges is None else edges
+        lo = 0 if price_min is None else bisect_left(self.prices, price_min)
+        hi = len(self.prices) if price_max is None else bisect_right(self.prices, price_max)
+        # price_min > price_max — пустой диапазон, а не отрицательный
+        hi = max(hi, lo)
+        count = hi - lo
+        bands = []
+        for i, band_min in enumerate(edges):
+            band_max = edges[i + 1] if i + 1 < len(edges) else None
+            start = max(lo, bisect_left(self.prices, band_min))
+            end = hi if band_max is None else min(hi, bisect_left(self.prices, band_max))
+            bands.append({"min": band_min, "max": band_max, "count": max(0, end - start)})
+
+        if count:
+            middle = lo + count // 2
+            median = self.prices[middle] if count % 2 else (self.prices[middle - 1] + self.prices[middle]) / 2
+        else:
+            median = None
+        return {
+            "version": self.version,
+            "count": count,
+            "min": self.prices[lo] if count else None,
+            "max": self.prices[hi - 1] if count else None,
+            "median": median,
+            "bands": bands,
+        }
+
+    def get(self, package_id):
+        return self.by_id.get(package_id)
+
+    # Возвращает (страница, ключ последнего элемента или None, если страница последняя)
+    def query(self, price_min=None, price_max=None, sort_by="name", after=None, limit=None):
+        lo = 0 if price_min is None else bisect_left(self.prices, price_min)
+        hi = max(lo, len(self.prices) if price_max is None else bisect_right(self.prices, price_max))
+
+        if sort_by == "price":
+            packages, keys = self.by_price, self.price_keys
+        elif price_min is None and price_max is None:
+            packages, keys = self.by_name, self.name_keys
+        else:
+            packages = sorted(self.by_price[lo:hi], key=lambda p: (p["name"], p["id"]))
+            keys = [(p["name"], p["id"]) for p in packages]
+            lo, hi = 0, len(packages)
+
+        # Keyset: начинаем сразу после ключа из курсора
+        if after is not None:
+            lo = max(lo, bisect_right(keys, after))
+        end = hi if limit is None else min(hi, lo + limit)
+        next_key = keys[end - 1] if end < hi else None
+        return list(packages[lo:end]), next_key
+
+
+_current = None
+_generation = 0
+_lock = threading.Lock()
+
+
+def _row_to_dict(package):
+    return {field: getattr(package, field) for field in PACKAGE_FIELDS}
+
+
+def _load_query():
+    return select(*PACKAGE_COLUMNS)
+
+
+def _begin_load():
+    with _lock:
+        return _generation
+
+
+def _install(generation, packages):
+    global _current
+    snapshot = CatalogSnapshot.build(generation, packages)
+    with _lock:
+        # Не затираем снимок, загруженный после более свежей записи
+        if _current is None or generation >= _current.version:
+            _current = snapshot
+        return _current
+
+
+def _is_fresh():
+    snapshot = _current
+    return snapshot is not None and snapshot.version == _generation
+
+
+# Подписчики на изменение каталога (например, кэш отрендеренных страниц)
+_listeners = []
+
+
+def on_invalidate(callback):
+    _listeners.append(callback)
+    return callback
+
+
+def _notify():
+    for callback in _listeners:
+        callback()
+
+
+# Вызывается после каждой записи в renovation_packages
+def invalidate():
+    global _generation
+    with _lock:
+        _generation += 1
+    _notify()
+
+
+# Запись из другого процесса: снимок перечитается при следующем чтении
+coherence.subscribe("packages", invalidate)
+
+
+# Точечное обновление после записи: новый снимок строится из текущего без запроса к БД.
+# Если снимок уже устарел (была другая запись), он просто перечитается при следующем чтении
+def apply_change(upserts=(), deleted_ids=()):
+    global _current, _generation
+    upserts = [{field: p[field] for field in PACKAGE_FIELDS} if isinstance(p, dict) else _row_to_dict(p) for p in upserts]
+    with _lock:
+        fresh = _current is not None and _current.version == _generation
+        _generation += 1
+        if fresh:
+            _current = _current.apply(_generation, upserts, deleted_ids)
+    _notify()
+
+
+def get_catalog() -> CatalogSnapshot:
+    if _is_fresh():
+        return _current
+    generation = _begin_load()
+    db = ReadSessionLocal()
+    try:
+        with tracing.span("catalog", "load snapshot"):
+            packages = [dict(zip(PACKAGE_FIELDS, row)) for row in db.execute(_load_query())]
+    finally:
+        db.close()
+    return _install(generation, packages)
+
+
+async def get_catalog_async(db) -> CatalogSnapshot:
+    if _is_fresh():
+        return _current
+    generation = _begin_load()
+    with tracing.span("catalog", "load snapshot"):
+        packages = [dict(zip(PACKAGE_FIELDS, row)) for row in (await db.execute(_load_query())).all()]
+    return _install(generation, packages)
+
+
+# Атомарно подменяем снимок новой версией после записи
+def refresh() -> CatalogSnapshot:
+    invalidate()
+    return get_catalog()
+
+
+async def refresh_async(db) -> CatalogSnapshot:
+    invalidate()
+    return await get_catalog_async(db)
+
+
+# Текущая версия каталога (для ETag): меняется при каждой записи
+def current_version():
+    return _generation
@@ -0,0 +1,197 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from sqlalchemy import DDL, event
+
+from database import DATABASE_URL, async_engine, engine
+from models import Base
+
+logger = logging.getLogger(__name__)
+
+# Как часто воркер проверяет, не писал ли в базу другой процесс (максимальная задержка сброса кэшей)
+COHERENCE_POLL_INTERVAL = float(os.getenv("COHERENCE_POLL_INTERVAL", "1"))
+
+# Счетчики изменений по областям кэша. Их увеличивают триггеры, поэтому учитываются
+# все пути записи: FastAPI, Flask, импорт, пакетные UPDATE и ручные правки в sqlite3
+SCOPES = ("packages", "users")
+TABLE_SCOPES = {"renovation_packages": "packages", "users": "users"}
+COHERENCE_DDL = [
+    "CREATE TABLE IF NOT EXISTS cache_versions (scope TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0)",
+    "INSERT OR IGNORE INTO cache_versions (scope, version) VALUES " + ", ".join(f"('{scope}', 0)" for scope in SCOPES),
+]
+for _table, _scope in (("renovation_packages", "packages"), ("users", "users")):
+    for _event in ("INSERT", "UPDATE", "DELETE"):
+        COHERENCE_DDL.append(
+            f"""CREATE TRIGGER IF NOT EXISTS {_table}_cache_version_{_event.lower()} AFTER {_event} ON {_table} BEGIN
+        UPDATE cache_versions SET version = version + 1 WHERE scope = '{_scope}';
+    END"""
+        )
+
+# Новая база: таблица и триггеры создаются вместе со схемой
+for statement in COHERENCE_DDL:
+    event.listen(Base.metadata, "after_create", DDL(statement))
+
+# Свои записи процесса: TEMP-триггеры срабатывают только для команд своего соединения
+# и считают те же строки, что и общие триггеры. Так воркер отличает свои изменения
+# (кэши уже обновлены точечно) от чужих
+OWN_WRITES_DDL = [
+    "CREATE TEMP TABLE IF NOT EXISTS own_writes (scope TEXT PRIMARY KEY, n INTEGER NOT NULL DEFAULT 0)",
+    "INSERT OR IGNORE INTO temp.own_writes (scope, n) VALUES " + ", ".join(f"('{scope}', 0)" for scope in SCOPES),
+]
+for _table, _scope in TABLE_SCOPES.items():
+    for _event in ("INSERT", "UPDATE", "DELETE"):
+        OWN_WRITES_DDL.append(
+            f"""CREATE TEMP TRIGGER IF NOT EXISTS own_{_table}_{_event.lower()} AFTER {_event} ON main.{_table} BEGIN
+        UPDATE own_writes SET n = n + 1 WHERE scope = '{_scope}';
+    END"""
+        )
+
+
+def _database_path(url):
+    _, _, path = url.partition(":///")
+    if not path or path == ":memory:":
+        return None
+    return path
+
+
+class ChangeWatcher:
+    # PRAGMA data_version меняется, только если базу закоммитило другое соединение (в том числе
+    # соединение этого же процесса), и стоит дешевле любого запроса. Таблица cache_versions
+    # читается лишь после такого изменения; прирост от своих записей вычитается
+    def __init__(self, path, interval=COHERENCE_POLL_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self._callbacks = {scope: [] for scope in SCOPES}
+        self._versions = None
+        self._data_version = None
+        self._next_poll = 0.0
+        self._conn = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._own = {}
+        self._own_lock = threading.Lock()
+
+    def subscribe(self, scope, callback):
+        self._callbacks[scope].append(callback)
+        return callback
+
+    # Сколько раз этот процесс сам увеличил счетчики (вызывается при commit)
+    def note_own(self, counts):
+        with self._own_lock:
+            for scope, n in counts:
+                self._own[scope] = self._own.get(scope, 0) + n
+
+    def _connect(self):
+        # После fork (gunicorn --preload) соединение родителя использовать нельзя
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            self._pid = os.getpid()
+            self._data_version = None
+        return self._conn
+
+    # Вызывается на каждый запрос: между опросами это одно сравнение времени
+    def poll(self, force=False):
+        if self.path is None:
+            return
+        now = time.monotonic()
+        if not force and now < self._next_poll:
+            return
+        # Опрашивает один поток, остальные не ждут
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._next_poll = now + self.interval
+            changed = self._check()
+        except sqlite3.Error as e:
+            # База еще не создана или не смигрирована — попробуем на следующем опросе
+            logger.debug("Cache coherence poll failed: %s", e)
+            self._conn = None
+            return
+        finally:
+            self._lock.release()
+        for scope in changed:
+            for callback in self._callbacks[scope]:
+                callback()
+
+    def _check(self):
+        conn = self._connect()
+        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version:
+            return []
+        self._data_version = data_version
+        versions = dict(conn.execute("SELECT scope, version FROM cache_versions").fetchall())
+        with self._own_lock:
+            own, self._own = self._own, {}
+        # При первом опросе (previous is None) сбрасываются все области — кэши могли
+        # заполниться раньше, чем таблица cache_versions стала доступна
+        previous, self._versions = self._versions, versions or {}
+        if not previous:
+            return list(SCOPES)
+        # Область сбрасываем, только если счетчик вырос не только из-за своих записей
+        return [scope for scope in SCOPES if versions.get(scope, 0) - previous.get(scope, 0) != own.get(scope, 0)]
+
+
+watcher = ChangeWatcher(_database_path(DATABASE_URL))
+
+
+def subscribe(scope, callback):
+    return watcher.subscribe(scope, callback)
+
+
+# При выдаче из пула, пока транзакции нет: соединение, открытое до миграций,
+# получит TEMP-триггеры при следующей выдаче
+def _install_own_writes(dbapi_connection, connection_record, connection_proxy):
+    if connection_record.info.get("own_writes"):
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        for statement in OWN_WRITES_DDL:
+            cursor.execute(statement)
+        dbapi_connection.commit()
+        connection_record.info["own_writes"] = True
+    except Exception as e:
+        dbapi_connection.rollback()
+        # Схема еще не создана: записи этого соединения будут считаться чужими (лишний сброс кэша)
+        logger.debug("Own-write tracking unavailable: %s", e)
+    finally:
+        cursor.close()
+
+
+# Перед commit (блокировка записи еще у нас) забираем счетчики своих записей
+def _note_own_writes(conn):
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        counts = cursor.execute("SELECT scope, n FROM temp.own_writes WHERE n > 0").fetchall()
+        if counts:
+            cursor.execute("UPDATE temp.own_writes SET n = 0 WHERE n > 0")
+            watcher.note_own(counts)
+    except Exception as e:
+        logger.debug("Own-write tracking unavailable: %s", e)
+    finally:
+        cursor.close()
+
+
+# Только движки записи: соединения только для чтения ничего не меняют
+for _engine in (engine, async_engine.sync_engine):
+    event.listen(_engine, "checkout", _install_own_writes)
+    event.listen(_engine, "commit", _note_own_writes)
+
+
+class CoherenceMiddleware:
+    # ASGI-middleware для FastAPI: перед запросом проверяем, не изменил ли базу другой воркер
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            watcher.poll()
+        await self.app(scope, receive, send)
+
+
+def init_flask(flask_app):
+    @flask_app.before_request
+    def coherence_poll():
+        watcher.poll()
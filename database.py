@@ -1,17 +1,92 @@
-from sqlalchemy import create_engine
+import os
+
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
 # Укажите вашу строку подключения к базе данных
-DATABASE_URL = "sqlite:///./renovation.db"  # Для SQLite (замените на вашу СУБД, если требуется)
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./renovation.db")  # Для SQLite (замените на вашу СУБД, если требуется)
+
+
+# Профиль SQLite: pragma-настройки и размеры пулов (переопределяются через переменные окружения)
+class EngineProfile:
+    def __init__(self):
+        self.journal_mode = os.getenv("DB_JOURNAL_MODE", "WAL")
+        self.synchronous = os.getenv("DB_SYNCHRONOUS", "NORMAL")
+        self.mmap_size = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+        self.cache_size = int(os.getenv("DB_CACHE_SIZE", "-65536"))  # отрицательное значение — в КиБ (64 МиБ)
+        self.busy_timeout = int(os.getenv("DB_BUSY_TIMEOUT", "5000"))  # мс
+        self.temp_store = os.getenv("DB_TEMP_STORE", "MEMORY")
+        # SQLite допускает одного писателя, поэтому пул записи небольшой
+        self.write_pool_size = int(os.getenv("DB_WRITE_POOL_SIZE", "4"))
+        self.read_pool_size = int(os.getenv("DB_READ_POOL_SIZE", "10"))
+        self.max_overflow = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+        self.pool_timeout = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+
+    def pragmas(self, readonly=False):
+        pragmas = [
+            f"PRAGMA busy_timeout = {self.busy_timeout}",
+            f"PRAGMA cache_size = {self.cache_size}",
+            f"PRAGMA mmap_size = {self.mmap_size}",
+            f"PRAGMA temp_store = {self.temp_store}",
+        ]
+        # Режим журнала хранится в самом файле БД, его выставляет только писатель
+        if not readonly:
+            pragmas = [f"PRAGMA journal_mode = {self.journal_mode}", f"PRAGMA synchronous = {self.synchronous}"] + pragmas
+        return pragmas
+
+
+profile = EngineProfile()
+
+
+def _apply_pragmas(sync_engine, readonly=False):
+    pragmas = profile.pragmas(readonly)
+
+    @event.listens_for(sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+
+def _pool_args(pool_size, poolclass=QueuePool):
+    return {
+        "poolclass": poolclass,
+        "pool_size": pool_size,
+        "max_overflow": profile.max_overflow,
+        "pool_timeout": profile.pool_timeout,
+    }
+
+
+# URL только для чтения: тот же файл, открытый через URI с mode=ro
+def _readonly_url(url):
+    prefix, _, path = url.partition(":///")
+    if not path or path == ":memory:":
+        return None
+    return f"{prefix}:///file:{path}?mode=ro&uri=true"
+
 
-# Создаем движок подключения
+# Создаем движок подключения (чтение и запись)
 engine = create_engine(
-    DATABASE_URL, connect_args={"check_same_thread": False}  # Для SQLite
+    DATABASE_URL, connect_args={"check_same_thread": False}, **_pool_args(profile.write_pool_size)  # Для SQLite
 )
+_apply_pragmas(engine)
+
+# Отдельный движок только для чтения: в режиме WAL читатели не ждут писателя
+READONLY_DATABASE_URL = _readonly_url(DATABASE_URL)
+if READONLY_DATABASE_URL:
+    read_engine = create_engine(
+        READONLY_DATABASE_URL, connect_args={"check_same_thread": False}, **_pool_args(profile.read_pool_size)
+    )
+    _apply_pragmas(read_engine, readonly=True)
+else:
+    read_engine = engine
 
 # Создаем фабрику сессий
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 
 # Базовый класс для всех моделей
 Base = declarative_base()
@@ -23,3 +98,37 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# Асинхронный движок (aiosqlite), чтобы запросы не блокировали event loop FastAPI
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+
+ASYNC_DATABASE_URL = DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1)
+
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_pool_args(profile.write_pool_size, AsyncAdaptedQueuePool))
+_apply_pragmas(async_engine.sync_engine)
+
+if READONLY_DATABASE_URL:
+    async_read_engine = create_async_engine(
+        READONLY_DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1),
+        **_pool_args(profile.read_pool_size, AsyncAdaptedQueuePool)
+    )
+    _apply_pragmas(async_read_engine.sync_engine, readonly=True)
+else:
+    async_read_engine = async_engine
+
+# expire_on_commit=False: после commit объекты можно отдавать в ответ без повторного запроса
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False, autoflush=False)
+AsyncReadSessionLocal = async_sessionmaker(async_read_engine, class_=AsyncSession, expire_on_commit=False, autoflush=False)
+
+
+# Асинхронная зависимость для FastAPI
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+# Сессия только для чтения (GET-эндпоинты)
+async def get_async_read_db():
+    async with AsyncReadSessionLocal() as db:
+        yield db
@@ -0,0 +1,13 @@
+import json
+
+try:
+    import orjson
+except ImportError:  # без orjson работаем на stdlib json с тем же компактным форматом
+    orjson = None
+
+
+# Сериализация в байты в том же формате, что и JSONResponse FastAPI
+def dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
@@ -0,0 +1,96 @@
+import asyncio
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+import metrics
+import tracing
+
+# Настройки пула хэширования (можно переопределить через переменные окружения)
+HASH_POOL_SIZE = int(os.getenv("HASH_POOL_SIZE", os.cpu_count() or 2))
+HASH_QUEUE_DEPTH = int(os.getenv("HASH_QUEUE_DEPTH", "64"))
+HASH_TARGET_MS = float(os.getenv("HASH_TARGET_MS", "250"))
+BCRYPT_MIN_ROUNDS = 10
+BCRYPT_MAX_ROUNDS = 16
+BCRYPT_DEFAULT_ROUNDS = 12
+
+
+class HashQueueFull(Exception):
+    pass
+
+
+# Время самого вычисления bcrypt (без ожидания в очереди)
+def _timed(operation, func, *args):
+    start = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        metrics.HASH_DURATION.observe(time.perf_counter() - start, operation)
+
+
+# Стоимость (cost) из строки хэша вида "$2b$12$..."
+def get_rounds(hashed: str) -> int:
+    try:
+        return int(hashed.split("$")[2])
+    except (IndexError, ValueError):
+        return 0
+
+
+class PasswordHasher:
+    # bcrypt отпускает GIL, поэтому пул потоков действительно параллелит хэширование
+    # и не блокирует event loop uvicorn
+    def __init__(self, pool_size: int = HASH_POOL_SIZE, queue_depth: int = HASH_QUEUE_DEPTH):
+        self.pool_size = pool_size
+        self.queue_depth = queue_depth
+        self.rounds = BCRYPT_DEFAULT_ROUNDS
+        self.pending = 0
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="bcrypt")
+        return self._executor
+
+    # Подбираем cost так, чтобы один хэш занимал примерно target_ms
+    def calibrate(self, target_ms: float = HASH_TARGET_MS) -> int:
+        start = time.perf_counter()
+        bcrypt.hashpw(b"calibration", bcrypt.gensalt(BCRYPT_MIN_ROUNDS))
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        # Каждый следующий раунд удваивает время
+        extra = int(math.log2(target_ms / elapsed_ms)) if elapsed_ms < target_ms else 0
+        self.rounds = max(BCRYPT_MIN_ROUNDS, min(BCRYPT_MAX_ROUNDS, BCRYPT_MIN_ROUNDS + extra))
+        return self.rounds
+
+    async def _run(self, operation, func, *args):
+        if self.pending >= self.queue_depth:
+            raise HashQueueFull()
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            # Спан включает и ожидание свободного потока в пуле
+            with tracing.span("hash", operation):
+                return await loop.run_in_executor(self._get_executor(), _timed, operation, func, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        hashed = await self._run("hash", bcrypt.hashpw, password.encode("utf-8"), bcrypt.gensalt(self.rounds))
+        return hashed.decode("utf-8")
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._run("verify", bcrypt.checkpw, password.encode("utf-8"), hashed.encode("utf-8"))
+
+    # Хэш считается устаревшим, если его cost ниже текущего (понижать не будем)
+    def needs_rehash(self, hashed: str) -> bool:
+        return get_rounds(hashed) < self.rounds
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+hasher = PasswordHasher()
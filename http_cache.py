@@ -0,0 +1,160 @@
+import gzip
+import hashlib
+import os
+import time
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен, без него отдаем только gzip
+    brotli = None
+
+import catalog
+
+# Сжимаем только ответы больше порога
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "application/x-ndjson")
+
+CATALOG_CACHE_CONTROL = "public, max-age=30, stale-while-revalidate=60"
+
+# Версии каталога начинаются с нуля в каждом процессе, поэтому в ETag добавляем
+# идентификатор запуска, чтобы ETag разных процессов/перезапусков не совпадали
+BOOT_ID = f"{os.getpid():x}{int(time.time()):x}"
+
+
+# Правила кэширования: путь -> (Cache-Control, функция версии данных)
+def catalog_rule(path):
+    if path in ("/packages/", "/packages/search", "/packages/facets", "/catalog") or path.startswith("/about_package/"):
+        return CATALOG_CACHE_CONTROL, catalog.current_version
+    return None
+
+
+def negotiate_encoding(accept_encoding):
+    accepted = {part.split(";")[0].strip() for part in (accept_encoding or "").lower().split(",")}
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+
+def should_compress(content_type, size, encoding):
+    return encoding is not None and size >= COMPRESS_MIN_SIZE and (content_type or "").startswith(COMPRESSIBLE_TYPES)
+
+
+# Сильный ETag из версии данных, а не из хэша тела ответа: 304 отдается без вызова обработчика
+def make_etag(version, path, query, encoding):
+    digest = hashlib.blake2b(f"{path}?{query}".encode("utf-8"), digest_size=6).hexdigest()
+    return f'"{BOOT_ID}-{version}-{digest}-{encoding or "id"}"'
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]
+
+
+class HTTPCacheMiddleware:
+    # ASGI-middleware для FastAPI: ETag/304, Cache-Control и сжатие gzip/brotli
+    def __init__(self, app, rule=catalog_rule):
+        self.app = app
+        self.rule = rule
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope["headers"]}
+        encoding = negotiate_encoding(headers.get("accept-encoding"))
+        extra_headers = []
+
+        rule = self.rule(scope["path"]) if scope["method"] in ("GET", "HEAD") else None
+        if rule is not None:
+            cache_control, version = rule
+            etag = make_etag(version(), scope["path"], scope.get("query_string", b"").decode("latin-1"), encoding)
+            extra_headers = [(b"etag", etag.encode("latin-1")), (b"cache-control", cache_control.encode("latin-1"))]
+            if etag_matches(headers.get("if-none-match"), etag):
+                await send({"type": "http.response.start", "status": 304, "headers": extra_headers})
+                await send({"type": "http.response.body", "body": b""})
+                return
+
+        start_message = None
+
+        async def send_wrapper(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                # Откладываем заголовки до первого куска тела, чтобы решить, сжимать ли его
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or start_message is None:
+                return await send(message)
+
+            start, start_message = start_message, None
+            response_headers = list(start["headers"])
+            if extra_headers and start["status"] == 200:
+                response_headers = [(k, v) for k, v in response_headers if k.lower() not in (b"etag", b"cache-control")]
+                response_headers += extra_headers
+            body = message.get("body", b"")
+            content_type = dict(response_headers).get(b"content-type", b"").decode("latin-1")
+            already_encoded = any(k.lower() == b"content-encoding" for k, _ in response_headers)
+
+            # Потоковые ответы (more_body) не буферизуем и не сжимаем
+            if not message.get("more_body") and not already_encoded and should_compress(content_type, len(body), encoding):
+                body = compress(body, encoding)
+                response_headers = [(k, v) for k, v in response_headers if k.lower() != b"content-length"]
+                response_headers += [
+                    (b"content-encoding", encoding.encode("latin-1")),
+                    (b"content-length", str(len(body)).encode("latin-1")),
+                    (b"vary", b"Accept-Encoding"),
+                ]
+                message = dict(message, body=body)
+            await send(dict(start, headers=response_headers))
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+# То же самое для Flask через before_request/after_request
+def init_flask(flask_app, rule=catalog_rule):
+    from flask import request
+
+    @flask_app.before_request
+    def conditional_get():
+        if request.method not in ("GET", "HEAD"):
+            return None
+        matched = rule(request.path)
+        if matched is None:
+            return None
+        cache_control, version = matched
+        encoding = negotiate_encoding(request.headers.get("Accept-Encoding"))
+        etag = make_etag(version(), request.path, request.query_string.decode("latin-1"), encoding)
+        request.environ["http_cache.headers"] = {"ETag": etag, "Cache-Control": cache_control}
+        if etag_matches(request.headers.get("If-None-Match"), etag):
+            response = flask_app.response_class(status=304)
+            response.headers.update(request.environ["http_cache.headers"])
+            return response
+        return None
+
+    @flask_app.after_request
+    def cache_and_compress(response):
+        cache_headers = request.environ.get("http_cache.headers")
+        if cache_headers and response.status_code == 200:
+            response.headers.update(cache_headers)
+            # Ответ с cookie нельзя отдавать из общего кэша
+            if "Set-Cookie" in response.headers:
+                response.headers["Cache-Control"] = "private, no-store"
+
+        encoding = negotiate_encoding(request.headers.get("Accept-Encoding"))
+        if (response.status_code == 200 and not response.direct_passthrough and not response.is_streamed
+                and "Content-Encoding" not in response.headers):
+            body = response.get_data()
+            if should_compress(response.content_type, len(body), encoding):
+                response.set_data(compress(body, encoding))
+                response.headers["Content-Encoding"] = encoding
+                response.vary.add("Accept-Encoding")
+        return response
@@ -0,0 +1,153 @@
+import hashlib
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Производные изображения (превью) для фото пакетов
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "./image_cache")
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+STATIC_DIR = os.getenv("STATIC_DIR", "static")
+
+WIDTHS = (160, 320, 640, 1280)
+FORMATS = ("webp", "jpeg")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+MEDIA_TYPES = {"webp": "image/webp", "jpeg": "image/jpeg"}
+
+# Имя файла в кэше: <sha256 от (путь, mtime, размер) исходника>-<ширина>.<формат>.
+# Замена файла меняет mtime/размер, а значит и имя — старые превью не отдаются
+DERIVATIVE_NAME = re.compile(r"^[0-9a-f]{32}-\d+\.(webp|jpeg)$")
+
+
+class DerivativeCache:
+    def __init__(self, cache_dir=IMAGE_CACHE_DIR, max_bytes=IMAGE_CACHE_MAX_BYTES, workers=IMAGE_WORKERS):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self._in_flight = set()
+        self._total_bytes = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="images")
+        return self._executor
+
+    # Превью строим только для локальных файлов из static/ (внешние URL отдаются как есть)
+    def source_path(self, photo_url):
+        if not photo_url or not photo_url.startswith("/static/"):
+            return None
+        root = os.path.realpath(STATIC_DIR)
+        path = os.path.realpath(os.path.join(root, photo_url[len("/static/"):]))
+        if not path.startswith(root + os.sep) or not os.path.isfile(path):
+            return None
+        return path
+
+    # Только stat, без чтения файла: вызывается на пути запроса при каждом рендере
+    def _digest(self, path):
+        stat = os.stat(path)
+        key = f"{path}\0{stat.st_mtime_ns}\0{stat.st_size}"
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+    def path_for(self, name):
+        return os.path.join(self.cache_dir, name)
+
+    # URL превью, если оно уже готово; иначе ставим генерацию в очередь и отдаем оригинал
+    def url(self, photo_url, width, fmt="webp"):
+        path = self.source_path(photo_url)
+        if path is None:
+            return photo_url
+        width = min((w for w in WIDTHS if w >= width), default=WIDTHS[-1])
+        name = f"{self._digest(path)}-{width}.{fmt}"
+        if os.path.exists(self.path_for(name)):
+            return f"/images/{name}"
+        self.schedule(photo_url)
+        return photo_url
+
+    def schedule(self, photo_url):
+        path = self.source_path(photo_url)
+        if path is None:
+            return
+        with self._lock:
+            if path in self._in_flight:
+                return
+            self._in_flight.add(path)
+        self._get_executor().submit(self._generate, path)
+
+    def _generate(self, path):
+        try:
+            from PIL import Image  # Pillow нужен только воркерам
+
+            digest = self._digest(path)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with Image.open(path) as original:
+                original = original.convert("RGB")
+                for width in WIDTHS:
+                    resized = original
+                    if original.width > width:
+                        height = round(original.height * width / original.width)
+                        resized = original.resize((width, height), Image.LANCZOS)
+                    for fmt in FORMATS:
+                        target = self.path_for(f"{digest}-{width}.{fmt}")
+                        if os.path.exists(target):
+                            continue
+                        # Пишем во временный файл и переименовываем — читатели не увидят недописанный файл
+                        tmp = f"{target}.{threading.get_ident()}.tmp"
+                        resized.save(tmp, format=fmt.upper(), quality=80, optimize=True)
+                        os.replace(tmp, target)
+                        self._add_bytes(os.path.getsize(target))
+        finally:
+            with self._lock:
+                self._in_flight.discard(path)
+        self._evict()
+
+    def _add_bytes(self, size):
+        with self._lock:
+            if self._total_bytes is not None:
+                self._total_bytes += size
+
+    def _scan(self):
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if DERIVATIVE_NAME.match(entry.name):
+                    stat = entry.stat()
+                    entries.append((stat.st_atime, stat.st_size, entry.path))
+        return entries
+
+    # LRU по времени последнего доступа (touch обновляет его при отдаче файла)
+    def _evict(self):
+        with self._lock:
+            if self._total_bytes is not None and self._total_bytes <= self.max_bytes:
+                return
+            entries = self._scan()
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except FileNotFoundError:
+                    pass
+            self._total_bytes = total
+
+    def touch(self, name):
+        try:
+            os.utime(self.path_for(name))
+        except FileNotFoundError:
+            pass
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+derivatives = DerivativeCache()
+
+
+def preferred_format(accept):
+    return "webp" if "image/webp" in (accept or "") else "jpeg"
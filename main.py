@@ -1,28 +1,50 @@
-from flask import Flask, render_template, request, redirect, url_for, make_response
+import os
+from flask import Flask, g, render_template, request, redirect, url_for, make_response, send_from_directory
 import requests
 from datetime import datetime
-from auth import get_current_user
+from backend_client import backend
+from auth import verify_access_token, access_token_expires_soon
 from database import SessionLocal, get_db
 from models import RenovationPackage
-
-# URL FastAPI
-FASTAPI_URL = "http://127.0.0.1:8000/api/"
+import catalog as package_catalog
+import http_cache
+import metrics
+import images
+import page_cache
+import coherence
+import tracing
 
 # Инициализация Flask-приложения
 flask_app = Flask(__name__)
+# Трассировка медленных запросов (TRACE_SLOW_REQUESTS=1), первой — чтобы учитывать все хуки
+tracing.init_flask(flask_app)
+# Метрики запросов и /metrics (регистрируются первыми, чтобы учитывать и 304 от кэша)
+metrics.init_flask(flask_app)
+# Сброс локальных кэшей после записи из других процессов (до проверки ETag)
+coherence.init_flask(flask_app)
+# ETag/304 и сжатие ответов
+http_cache.init_flask(flask_app)
+
+
+# API недоступно (в т.ч. открыт circuit breaker) — отвечаем сразу, не занимая воркер
+@flask_app.errorhandler(requests.RequestException)
+def backend_error(e):
+    return "Service temporarily unavailable", 503
 
 @flask_app.route("/", methods=["GET", "POST"])
 def index():
     user_data = None
+    users = None
     message = ""
 
     if request.method == "POST":
-        user_id = request.form.get("user_id")
+        # Можно указать несколько id через запятую или пробел
+        user_ids = request.form.get("user_id", "").replace(",", " ").split()
 
-        if user_id:
+        if len(user_ids) == 1:
             try:
                 # Отправляем запрос к FastAPI для получения данных пользователя
-                response = requests.get(f"http://127.0.0.1:8000/api/users/{user_id}")
+                response = backend.get(f"/api/users/{user_ids[0]}")
                 if response.status_code == 200:
                     user_data = response.json()
                     if "message" in user_data:
@@ -31,8 +53,78 @@ def index():
                     message = "Ошибка при запросе данных."
             except Exception as e:
                 message = f"Ошибка соединения: {e}"
+        elif user_ids:
+            try:
+                # Несколько пользователей — один пакетный запрос вместо запроса на каждый id
+                found, missing = backend.get_users(user_ids)
+                users = list(found.values())
+                if missing:
+                    message = f"Не найдены пользователи: {', '.join(map(str, missing))}"
+            except Exception as e:
+                message = f"Ошибка соединения: {e}"
+
+    return render_template("index.html", user_data=user_data, users=users, message=message)
+
+# Продлеваем сессию по refresh-токену, если access-токен скоро истечет (без bcrypt-логина)
+ACCESS_REFRESH_MARGIN = 300  # секунд
+REFRESH_COOKIE_MAX_AGE = 30 * 24 * 3600
 
-    return render_template("index.html", user_data=user_data, message=message)
+
+def set_refresh_cookie(resp, refresh_token):
+    if refresh_token:
+        resp.set_cookie("refresh_token", refresh_token, httponly=True, max_age=REFRESH_COOKIE_MAX_AGE, samesite="Lax")
+
+
+# Актуальный access-токен текущего запроса (с учетом только что выполненного обновления)
+def get_access_token():
+    if "refreshed_tokens" in g:
+        return g.refreshed_tokens["access_token"]
+    return request.cookies.get("access_token")
+
+
+@flask_app.before_request
+def refresh_session():
+    refresh_token = request.cookies.get("refresh_token")
+    if not refresh_token or request.path.startswith(("/static/", "/images/", "/metrics")):
+        return None
+    # Публичные кэшируемые страницы не должны нести Set-Cookie: их кэширует и общий кэш
+    if http_cache.catalog_rule(request.path) is not None:
+        return None
+    access_token = request.cookies.get("access_token")
+    if access_token and not access_token_expires_soon(access_token, ACCESS_REFRESH_MARGIN):
+        return None
+    try:
+        response = backend.post("/api/token/refresh", json={"refresh_token": refresh_token})
+    except requests.RequestException:
+        return None  # API недоступно — работаем с тем токеном, что есть
+    if response.status_code == 200:
+        g.refreshed_tokens = response.json()
+    elif response.status_code == 401:
+        # Refresh-токен истек или отозван — удаляем cookie, чтобы не ходить в API на каждый запрос
+        g.drop_refresh_token = True
+    # 409: токен только что обменяла параллельная вкладка, новая cookie приходит в ее ответе.
+    # Свою cookie не трогаем, иначе затрем только что выданную
+    return None
+
+
+@flask_app.after_request
+def store_refreshed_tokens(resp):
+    if "refreshed_tokens" in g:
+        resp.set_cookie("access_token", g.refreshed_tokens["access_token"], httponly=True)
+        set_refresh_cookie(resp, g.refreshed_tokens.get("refresh_token"))
+    elif g.get("drop_refresh_token"):
+        resp.delete_cookie("refresh_token")
+    return resp
+
+
+@flask_app.route("/images/<name>")
+def image(name):
+    if not images.DERIVATIVE_NAME.match(name):
+        return "Image not found", 404
+    images.derivatives.touch(name)
+    response = send_from_directory(os.path.abspath(images.derivatives.cache_dir), name)
+    response.headers["Cache-Control"] = images.IMMUTABLE_CACHE_CONTROL
+    return response
 
 @flask_app.route("/about")
 def about_us():
@@ -40,10 +132,8 @@ def about_us():
 
 @flask_app.route('/catalog', methods=['GET'])
 def catalog():
-    db = SessionLocal()
-    packages = db.query(RenovationPackage).all()
-    db.close()
-    return render_template('catalog.html', packages=packages)
+    snapshot = package_catalog.get_catalog()
+    return page_cache.render_cached(snapshot, 'catalog.html', (), lambda: {"packages": snapshot.by_id.values()})
 
 
 @flask_app.route("/register", methods=["GET", "POST"])
@@ -57,7 +147,7 @@ def register():
         data = {"name": name, "email": email, "password": password}
 
         # Отправляем запрос с JSON-данными
-        response = requests.post("http://127.0.0.1:8000/api/register/", json=data)
+        response = backend.post("/api/register/", json=data)
         if response.status_code == 200:
             return redirect(url_for("login"))
         else:
@@ -74,7 +164,7 @@ def login():
         password = request.form.get("password")
         data = {"email": email, "password": password}
 
-        response = requests.post(f"http://127.0.0.1:8000/api/login/", json=data)
+        response = backend.post("/api/login/", json=data)
         if response.status_code == 200:
             response_data = response.json()
             access_token = response_data.get("access_token")  # Получаем токен
@@ -82,6 +172,7 @@ def login():
                 # Создаем ответ с перенаправлением на страницу профиля
                 resp = make_response(redirect("/profile_page"))
                 resp.set_cookie("access_token", access_token, httponly=True)  # Сохраняем токен в cookie
+                set_refresh_cookie(resp, response_data.get("refresh_token"))
                 return resp
             else:
                 message = "Access token not found in response."
@@ -91,38 +182,32 @@ def login():
 
 @flask_app.route('/about_package/<int:package_id>', methods=['GET'])
 def about_package(package_id):
-    db = SessionLocal()
-    package = db.query(RenovationPackage).filter(RenovationPackage.id == package_id).first()
-    db.close()
+    snapshot = package_catalog.get_catalog()
+    package = snapshot.get(package_id)
     if not package:
         return "Package not found", 404
-    return render_template('about_package.html', package=package)
+    return page_cache.render_cached(snapshot, 'about_package.html', (package_id,), lambda: {"package": package})
 
 
 @flask_app.route("/profile_page")
 def profile_page():
     # Получаем токен из cookie
-    access_token = request.cookies.get("access_token")
+    access_token = get_access_token()
     if not access_token:
         return redirect("/login")  # Если токена нет, перенаправляем на страницу логина
 
-    # Получаем информацию о пользователе с FastAPI
-    response = requests.get(
-        "http://127.0.0.1:8000/profile",
-        headers={"Authorization": f"Bearer {access_token}"}
-    )
-
-    if response.status_code == 200:
-        user_data = response.json()  # Данные о пользователе из FastAPI
+    # Проверяем токен локально, данные о пользователе берем из его claims
+    user_data = verify_access_token(access_token)
+    if user_data:
         return render_template("profile.html", user=user_data)  # Передаем данные о пользователе в шаблон
     else:
-        return redirect("/login")  # Если не удалось получить данные о пользователе, редиректим на страницу логина
+        return redirect("/login")  # Если токен недействителен, редиректим на страницу логина
 
 
 
 @flask_app.route("/delete_profile", methods=["POST"])
 def delete_profile_page():
-    response = requests.delete("http://127.0.0.1:8000/profile", headers={"Authorization": f"Bearer {request.cookies.get('access_token')}"})
+    response = backend.delete("/profile", token=get_access_token())
     if response.status_code == 200:
         return render_template("index.html", message="Profile deleted successfully!")
     else:
@@ -138,11 +223,7 @@ def edit_profile_page():
             "email": request.form.get("email"),
             "password": request.form.get("password")
         }
-        response = requests.put(
-            "http://127.0.0.1:8000/profile",
-            json=data,
-            headers={"Authorization": f"Bearer {request.cookies.get('access_token')}"}
-        )
+        response = backend.put("/profile", json=data, token=get_access_token())
         if response.status_code == 200:
             return redirect("/profile_page")
         else:
@@ -150,33 +231,24 @@ def edit_profile_page():
     return render_template("edit_profile.html", message=message)
 
 from flask import render_template, redirect, url_for, request
-from auth import get_current_user
 
 @flask_app.route('/admin/catalog', methods=['GET', 'POST'])
 def admin_catalog():
     # Проверяем, что текущий пользователь — админ
-    access_token = request.cookies.get("access_token")
+    access_token = get_access_token()
     if not access_token:
         return redirect("/login")
 
-    response = requests.get(
-        "http://127.0.0.1:8000/profile",
-        headers={"Authorization": f"Bearer {access_token}"}
-    )
-
-    if response.status_code != 200:
+    user_data = verify_access_token(access_token)
+    if not user_data:
         return redirect("/login")
 
-    user_data = response.json()
     if user_data['role'] != 'admin':
         return redirect('/catalog')  # Перенаправляем обычных пользователей в общий каталог
 
     # Получаем список пакетов
-    db = SessionLocal()
-    packages = db.query(RenovationPackage).all()
-    db.close()
-
-    return render_template('admin_catalog.html', packages=packages)
+    snapshot = package_catalog.get_catalog()
+    return page_cache.render_cached(snapshot, 'admin_catalog.html', ("admin",), lambda: {"packages": snapshot.by_id.values()})
 
 
 @flask_app.route('/admin/create_package', methods=['GET', 'POST'])
@@ -193,7 +265,9 @@ def create_package():
         )
         db.add(new_package)
         db.commit()
+        package_catalog.apply_change(upserts=[new_package])
         db.close()
+        images.derivatives.schedule(photo_url)
         return redirect('/admin/catalog')
 
     return render_template('create_package.html')
@@ -208,8 +282,11 @@ def edit_package(package_id):
         package.description = request.form['description']
         package.price = float(request.form['price'])
         package.photo_url = request.form['photo_url']
+        package.version += 1
         db.commit()
+        package_catalog.apply_change(upserts=[package])
         db.close()
+        images.derivatives.schedule(request.form['photo_url'])
         return redirect('/admin/catalog')
 
     db.close()
@@ -222,13 +299,20 @@ def delete_package(package_id):
     db.delete(package)
     db.commit()
     db.close()
+    package_catalog.apply_change(deleted_ids=[package_id])
     return redirect('/admin/catalog')
 
 
+# Роль берется из claims проверенного токена (get_current_user — зависимость FastAPI)
+def current_user_role():
+    access_token = get_access_token()
+    user_data = verify_access_token(access_token) if access_token else None
+    return user_data["role"] if user_data else None
+
+
 @flask_app.route("/admin/packages")
 def admin_packages():
-    current_user = get_current_user()
-    if current_user.role != "admin":
+    if current_user_role() != "admin":
         return redirect(url_for("catalog"))
 
     db = next(get_db())
@@ -238,8 +322,7 @@ def admin_packages():
 
 @flask_app.route("/admin/packages/new")
 def add_package():
-    current_user = get_current_user()
-    if current_user.role != "admin":
+    if current_user_role() != "admin":
         return redirect(url_for("login"))
     return render_template("add_package.html")
 
@@ -0,0 +1,196 @@
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{str(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name, self.help, self.labels = name, help_text, labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for values, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, values)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    def dec(self, *label_values):
+        self.inc(*label_values, amount=-1)
+
+    def set(self, *label_values, value):
+        with self._lock:
+            self._values[label_values] = value
+
+    def render(self):
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help_text, labels, buckets
+        self._values = {}  # labels -> [счетчики по корзинам..., сумма, количество]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._values.get(label_values)
+            if data is None:
+                data = self._values[label_values] = [0] * (len(self.buckets) + 3)
+            data[index] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.labels + ("le",)
+        for values, data in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), data):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(names, values + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, values)} {data[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, values)} {data[-1]}")
+        return lines
+
+
+REQUEST_DURATION = Histogram("http_request_duration_seconds", "HTTP request latency", ("app", "method", "route"))
+REQUESTS_TOTAL = Counter("http_requests_total", "HTTP responses by status", ("app", "method", "route", "status"))
+IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests being processed", ("app",))
+REQUEST_QUERIES = Histogram("http_request_db_queries", "SQL queries per HTTP request", ("app", "route"), COUNT_BUCKETS)
+REQUEST_DB_TIME = Histogram("http_request_db_seconds", "Time spent in SQL per HTTP request", ("app", "route"))
+DB_QUERIES = Counter("db_queries_total", "SQL statements executed")
+DB_QUERY_DURATION = Histogram("db_query_duration_seconds", "SQL statement latency")
+HASH_DURATION = Histogram("bcrypt_duration_seconds", "bcrypt hash/verify time", ("operation",))
+STARTUP_SECONDS = Gauge("app_startup_seconds", "Worker cold start time by phase", ("phase",))
+
+REGISTRY = [
+    REQUEST_DURATION, REQUESTS_TOTAL, IN_FLIGHT, REQUEST_QUERIES, REQUEST_DB_TIME,
+    DB_QUERIES, DB_QUERY_DURATION, HASH_DURATION, STARTUP_SECONDS,
+]
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Счетчики SQL текущего запроса: [количество, суммарное время]
+_request_db = ContextVar("request_db", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["query_start"] = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info.pop("query_start", time.perf_counter())
+    DB_QUERIES.inc()
+    DB_QUERY_DURATION.observe(elapsed)
+    stats = _request_db.get()
+    if stats is not None:
+        stats[0] += 1
+        stats[1] += elapsed
+
+
+def start_request(app_name):
+    IN_FLIGHT.inc(app_name)
+    return _request_db.set([0, 0.0]), time.perf_counter()
+
+
+def finish_request(app_name, method, route, status, token, started):
+    elapsed = time.perf_counter() - started
+    queries, db_time = _request_db.get()
+    _request_db.reset(token)
+    IN_FLIGHT.dec(app_name)
+    REQUEST_DURATION.observe(elapsed, app_name, method, route)
+    REQUESTS_TOTAL.inc(app_name, method, route, status)
+    REQUEST_QUERIES.observe(queries, app_name, route)
+    REQUEST_DB_TIME.observe(db_time, app_name, route)
+
+
+class MetricsMiddleware:
+    # ASGI-middleware для FastAPI. Метка route — шаблон пути, чтобы не плодить серии на каждый id
+    def __init__(self, app, app_name="api"):
+        self.app = app
+        self.app_name = app_name
+
+    def _route(self, scope):
+        from starlette.routing import Match
+
+        for route in scope["app"].routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = 500
+        token, started = start_request(self.app_name)
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            finish_request(self.app_name, scope["method"], self._route(scope), status, token, started)
+
+
+def init_flask(flask_app, app_name="web"):
+    from flask import g, request
+
+    @flask_app.before_request
+    def metrics_start():
+        g.metrics_token, g.metrics_started = start_request(app_name)
+
+    @flask_app.teardown_request
+    def metrics_finish(exc):
+        if "metrics_token" not in g:
+            return
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        status = g.get("metrics_status", 500 if exc else 200)
+        finish_request(app_name, request.method, route, status, g.metrics_token, g.metrics_started)
+
+    @flask_app.after_request
+    def metrics_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @flask_app.route("/metrics")
+    def metrics_endpoint():
+        return render(), 200, {"Content-Type": CONTENT_TYPE}
@@ -0,0 +1,99 @@
+import os
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import inspect, text
+
+from database import engine
+from models import Base, RefreshToken
+from search import FTS_DDL, FTS_RANK, FTS_REBUILD, FTS_UPDATE_TRIGGER
+from coherence import COHERENCE_DDL
+
+# Изменения схемы для уже существующих баз. Номер миграции = позиция в списке,
+# примененная версия хранится в PRAGMA user_version
+MIGRATIONS = [
+    # 1: версия токена для отзыва выданных JWT
+    ["ALTER TABLE users ADD COLUMN token_version INTEGER NOT NULL DEFAULT 0"],
+    # 2: составные индексы для keyset-пагинации каталога
+    [
+        "CREATE INDEX IF NOT EXISTS ix_renovation_packages_name_id ON renovation_packages (name, id)",
+        "CREATE INDEX IF NOT EXISTS ix_renovation_packages_price_id ON renovation_packages (price, id)",
+    ],
+    # 3: полнотекстовый поиск по пакетам (FTS5)
+    FTS_DDL + [FTS_REBUILD],
+    # 4: refresh-токены
+    [lambda conn: RefreshToken.__table__.create(conn, checkfirst=True)],
+    # 5: версия пакета для оптимистичных блокировок
+    ["ALTER TABLE renovation_packages ADD COLUMN version INTEGER NOT NULL DEFAULT 0"],
+    # 6: счетчики изменений для согласования кэшей между воркерами
+    COHERENCE_DDL,
+    # 7: ранжирование поиска встроенной колонкой rank (сортировка без временного B-дерева)
+    [FTS_RANK],
+    # 8: триггер FTS только на изменение названия и описания
+    ["DROP TRIGGER IF EXISTS renovation_packages_fts_au", FTS_UPDATE_TRIGGER],
+]
+
+
+def _schema_state(conn):
+    return not inspect(conn).has_table("users"), conn.execute(text("PRAGMA user_version")).scalar()
+
+
+def migrate(bind=engine):
+    with bind.begin() as conn:
+        fresh, version = _schema_state(conn)
+        if not fresh and version >= len(MIGRATIONS):
+            return False
+
+        # Новая база создается сразу в актуальной схеме
+        if not fresh:
+            for statements in MIGRATIONS[version:]:
+                for statement in statements:
+                    # Шаг миграции — SQL-строка или функция от соединения
+                    if callable(statement):
+                        statement(conn)
+                    else:
+                        conn.execute(text(statement))
+
+        Base.metadata.create_all(bind=conn)
+        conn.execute(text(f"PRAGMA user_version = {len(MIGRATIONS)}"))
+    return True
+
+
+# Межпроцессная блокировка на время миграции, чтобы воркеры не мигрировали одновременно
+@contextmanager
+def _file_lock(path):
+    try:
+        import fcntl
+    except ImportError:  # не POSIX: остается только блокировка самой SQLite
+        yield
+        return
+    with open(path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+# Вызывается при старте каждого воркера: если схема актуальна, стоит один PRAGMA без
+# блокировки записи. SKIP_MIGRATIONS=1 — миграции запускаются отдельным шагом деплоя
+def migrate_once(bind=engine):
+    if os.getenv("SKIP_MIGRATIONS"):
+        return False
+    with bind.connect() as conn:
+        fresh, version = _schema_state(conn)
+    if not fresh and version >= len(MIGRATIONS):
+        return False
+
+    database = bind.url.database
+    if not database or database == ":memory:":
+        return migrate(bind)
+    with _file_lock(f"{database}.migrate.lock"):
+        # Пока ждали блокировку, другой воркер мог уже все применить
+        return migrate(bind)
+
+
+if __name__ == "__main__":
+    started = time.perf_counter()
+    applied = migrate_once()
+    print(f"{'migrated' if applied else 'schema up to date'} in {time.perf_counter() - started:.3f}s")
@@ -1,8 +1,5 @@
 from sqlalchemy import Column, Integer, String
 from database import Base
-from sqlalchemy.orm import declarative_base
-
-Base = declarative_base()
 
 # Модель для таблицы пользователей
 class User(Base):
@@ -13,9 +10,10 @@ class User(Base):
     email = Column(String, unique=True, index=True, nullable=False)
     password = Column(String, nullable=False)
     role = Column(String, default="client")  # Роль пользователя (admin или client)
+    token_version = Column(Integer, nullable=False, default=0)  # Увеличивается при отзыве токенов
 
 
-from sqlalchemy import Column, Integer, String, Float, Text
+from sqlalchemy import Column, Integer, String, Float, Text, Index
 
 class RenovationPackage(Base):
     __tablename__ = "renovation_packages"
@@ -26,4 +24,27 @@ class RenovationPackage(Base):
     price = Column(Integer, nullable=False)  # Цена
     photo_url = Column(String, nullable=True)  # URL для фото
     video_url = Column(String, nullable=True)  # URL для видео
+    version = Column(Integer, nullable=False, default=0)  # Для оптимистичных блокировок при правке
+
+    # Индексы под keyset-пагинацию по имени и по цене
+    __table_args__ = (
+        Index("ix_renovation_packages_name_id", "name", "id"),
+        Index("ix_renovation_packages_price_id", "price", "id"),
+    )
+
+
+
+from sqlalchemy import Boolean, DateTime, ForeignKey
+
+# Refresh-токены: хранится только sha256 от токена. Все токены одной цепочки ротации
+# имеют общий family_id — при повторном использовании токена отзывается вся цепочка
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
 
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    token_hash = Column(String, nullable=False, unique=True)
+    family_id = Column(String, nullable=False, index=True)
+    expires_at = Column(DateTime, nullable=False)
+    used_at = Column(DateTime, nullable=True)  # Когда токен был обменян на новый
+    revoked = Column(Boolean, nullable=False, default=False)
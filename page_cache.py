@@ -0,0 +1,63 @@
+import os
+import threading
+from collections import OrderedDict
+
+from flask import render_template
+
+import catalog
+
+# Кэш отрендеренных страниц каталога (HTML), ограничен по суммарному размеру
+PAGE_CACHE_MAX_BYTES = int(os.getenv("PAGE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+
+class PageCache:
+    def __init__(self, max_bytes=PAGE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            page = self._pages.get(key)
+            if page is not None:
+                self._pages.move_to_end(key)
+            return page
+
+    def put(self, key, page):
+        page_size = len(page)
+        if page_size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._pages.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._pages[key] = page
+            self.size += page_size
+            # LRU: выбрасываем давно не запрошенные страницы
+            while self.size > self.max_bytes:
+                _, evicted = self._pages.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+            self.size = 0
+
+
+pages = PageCache()
+
+# Любая запись в каталог (через catalog.refresh/invalidate) сбрасывает кэш
+catalog.on_invalidate(pages.clear)
+
+
+# Рендер с кэшированием. Ключ: версия снимка каталога, шаблон и входные данные шаблона.
+# context_factory вызывается только при промахе
+def render_cached(snapshot, template, key, context_factory):
+    cache_key = (snapshot.version, template) + tuple(key)
+    page = pages.get(cache_key)
+    if page is not None:
+        return page
+    page = render_template(template, **context_factory())
+    pages.put(cache_key, page)
+    return page
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field, validator
+from typing import Dict, List, Optional
 
 # Базовая схема для чтения данных
 class UserBase(BaseModel):
@@ -22,6 +22,10 @@ class UserLogin(BaseModel):
     email: str
     password: str
 
+# Схема для обновления access-токена
+class TokenRefresh(BaseModel):
+    refresh_token: str
+
 # Схема для ответа о пользователе
 class UserResponse(BaseModel):
     id: int
@@ -50,3 +54,63 @@ class RenovationPackageResponse(RenovationPackageBase):
     class Config:
         from_attributes = True
 
+
+# Пакет в админке: с версией для оптимистичных блокировок (PackagePatch.version)
+class AdminPackageResponse(RenovationPackageResponse):
+    version: int
+
+
+
+# Результат полнотекстового поиска с подсветкой совпадений
+class RenovationPackageSearchResult(RenovationPackageResponse):
+    name_highlight: str
+    description_snippet: str
+    rank: float
+
+
+# Ответ пакетного поиска пользователей
+class UserBatchResponse(BaseModel):
+    users: Dict[int, UserBase]
+    missing: List[int]
+
+
+# Частичное обновление пакета: version — версия, которую видел админ (оптимистичная блокировка)
+class PackagePatch(BaseModel):
+    id: int
+    version: int
+    name: Optional[str] = None
+    description: Optional[str] = None
+    price: Optional[int] = None
+    photo_url: Optional[str] = None
+    video_url: Optional[str] = None
+
+    # Обязательные поля пакета можно не передавать, но нельзя обнулить
+    @validator("name", "description", "price", pre=True)
+    def not_null(cls, value):
+        if value is None:
+            raise ValueError("may be omitted but not null")
+        return value
+
+
+# Правило переоценки: цена * (1 + percent / 100) для пакетов в диапазоне [price_min, price_max]
+class RepriceRule(BaseModel):
+    # Снижение на 100% и больше обнулило бы или сделало отрицательными цены
+    percent: float = Field(..., gt=-100)
+    price_min: Optional[float] = None
+    price_max: Optional[float] = None
+
+
+# Пакетное изменение: список правок и/или правило, все в одной транзакции
+class PackageBatchUpdate(BaseModel):
+    updates: List[PackagePatch] = []
+    rule: Optional[RepriceRule] = None
+
+
+class PackageBatchItem(BaseModel):
+    id: int
+    price: int
+    version: int
+
+
+class PackageBatchResult(BaseModel):
+    updated: List[PackageBatchItem]
@@ -0,0 +1,73 @@
+import re
+
+from sqlalchemy import DDL, event, text
+
+from models import RenovationPackage
+
+# Индекс обновляется только при правке названия или описания: переоценка и рост
+# версии при пакетных правках не переписывают записи FTS
+FTS_UPDATE_TRIGGER = """CREATE TRIGGER IF NOT EXISTS renovation_packages_fts_au AFTER UPDATE OF name, description ON renovation_packages BEGIN
+        INSERT INTO renovation_packages_fts(renovation_packages_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO renovation_packages_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END"""
+
+# FTS5-индекс по названию и описанию пакетов (external content: текст хранится
+# только в renovation_packages, индекс синхронизируется триггерами)
+FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS renovation_packages_fts USING fts5(
+        name, description,
+        content='renovation_packages', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS renovation_packages_fts_ai AFTER INSERT ON renovation_packages BEGIN
+        INSERT INTO renovation_packages_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS renovation_packages_fts_ad AFTER DELETE ON renovation_packages BEGIN
+        INSERT INTO renovation_packages_fts(renovation_packages_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END""",
+    FTS_UPDATE_TRIGGER,
+]
+
+# Заполнение индекса для уже существующих строк
+FTS_REBUILD = "INSERT INTO renovation_packages_fts(renovation_packages_fts) VALUES ('rebuild')"
+
+# Ранжирование по умолчанию для встроенной колонки rank: bm25, совпадение в названии
+# весит больше, чем в описании. ORDER BY rank FTS5 выполняет сам, без временного B-дерева
+FTS_RANK = "INSERT INTO renovation_packages_fts(renovation_packages_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0)')"
+
+# Новая база: индекс и триггеры создаются вместе с таблицей
+for statement in FTS_DDL + [FTS_RANK]:
+    event.listen(RenovationPackage.__table__, "after_create", DDL(statement))
+
+SEARCH_SQL = text("""
+    SELECT p.id, p.name, p.description, p.price, p.photo_url, p.video_url,
+           highlight(renovation_packages_fts, 0, '<mark>', '</mark>') AS name_highlight,
+           snippet(renovation_packages_fts, 1, '<mark>', '</mark>', '…', 16) AS description_snippet,
+           renovation_packages_fts.rank AS rank
+    FROM renovation_packages_fts
+    JOIN renovation_packages AS p ON p.id = renovation_packages_fts.rowid
+    WHERE renovation_packages_fts MATCH :query
+    ORDER BY renovation_packages_fts.rank
+    LIMIT :limit
+""")
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+# Превращаем пользовательский ввод в безопасный MATCH-запрос: каждое слово в кавычках
+# и с префиксным поиском, слова объединяются через AND
+def build_match_query(q: str):
+    words = _WORD.findall(q)
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
+async def search_packages(db, q: str, limit: int):
+    query = build_match_query(q)
+    if query is None:
+        return []
+    result = await db.execute(SEARCH_SQL, {"query": query, "limit": limit})
+    return [dict(row) for row in result.mappings()]
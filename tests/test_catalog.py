@@ -0,0 +1,99 @@
+# Снимок каталога: инкрементальный apply и keyset-пагинация должны совпадать
+# с полной перестройкой и прямой фильтрацией (случайные изменения, фиксированный seed)
+import os
+import random
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_scratch = tempfile.mkdtemp(prefix="truewood-test-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_scratch, 'test.db')}")
+
+from catalog import CatalogSnapshot
+
+NAMES = ["Кухня", "Ванная", "Спальня", "Офис", "Балкон"]
+
+
+def make_package(rng, package_id):
+    # Повторяющиеся названия и цены — ключи сортировки различаются только id
+    return {"id": package_id, "name": rng.choice(NAMES), "price": rng.randint(0, 50) * 100}
+
+
+def expected(packages, price_min, price_max, sort_by):
+    items = [p for p in packages
+             if (price_min is None or p["price"] >= price_min) and (price_max is None or p["price"] <= price_max)]
+    return sorted(items, key=lambda p: (p[sort_by], p["id"]))
+
+
+def paginate(snapshot, price_min, price_max, sort_by, limit):
+    pages, after = [], None
+    while True:
+        page, after = snapshot.query(price_min, price_max, sort_by, after=after, limit=limit)
+        pages.extend(page)
+        if after is None:
+            return pages
+
+
+def random_range(rng):
+    bound = lambda: rng.choice([None, rng.randint(0, 50) * 100, rng.randint(0, 5000)])
+    return bound(), bound()
+
+
+def test_apply_matches_rebuild():
+    rng = random.Random(42)
+    packages = {i: make_package(rng, i) for i in range(1, 201)}
+    snapshot = CatalogSnapshot.build(0, list(packages.values()))
+    next_id = 201
+    for version in range(1, 201):
+        deleted = rng.sample(sorted(packages), rng.randint(0, 3))
+        for package_id in deleted:
+            del packages[package_id]
+        upserts = [make_package(rng, package_id) for package_id in rng.sample(sorted(packages), min(len(packages), rng.randint(0, 3)))]
+        for _ in range(rng.randint(0, 3)):
+            upserts.append(make_package(rng, next_id))
+            next_id += 1
+        packages.update((p["id"], p) for p in upserts)
+        snapshot = snapshot.apply(version, upserts, deleted)
+
+        rebuilt = CatalogSnapshot.build(version, list(packages.values()))
+        assert snapshot.name_keys == rebuilt.name_keys
+        assert snapshot.price_keys == rebuilt.price_keys
+        assert snapshot.prices == rebuilt.prices
+        assert snapshot.by_id == rebuilt.by_id
+
+
+def test_keyset_pagination_matches_filter():
+    rng = random.Random(7)
+    packages = [make_package(rng, i) for i in range(1, 301)]
+    snapshot = CatalogSnapshot.build(0, packages)
+    for _ in range(200):
+        price_min, price_max = random_range(rng)
+        sort_by = rng.choice(["name", "price"])
+        limit = rng.randint(1, 40)
+        assert paginate(snapshot, price_min, price_max, sort_by, limit) == expected(packages, price_min, price_max, sort_by)
+
+
+def test_facets_match_filter():
+    rng = random.Random(3)
+    packages = [make_package(rng, i) for i in range(1, 301)]
+    snapshot = CatalogSnapshot.build(0, packages)
+    for _ in range(200):
+        price_min, price_max = random_range(rng)
+        prices = [p["price"] for p in expected(packages, price_min, price_max, "price")]
+        facets = snapshot.facets(price_min, price_max)
+        assert facets["count"] == len(prices)
+        assert facets["min"] == (prices[0] if prices else None)
+        assert facets["max"] == (prices[-1] if prices else None)
+        assert sum(band["count"] for band in facets["bands"]) == len(prices)
+
+
+def test_inverted_range_is_empty():
+    snapshot = CatalogSnapshot.build(0, [{"id": i, "name": f"p{i}", "price": i} for i in range(100)])
+    facets = snapshot.facets(52, 42)
+    assert facets["count"] == 0
+    assert facets["min"] is None and facets["max"] is None and facets["median"] is None
+    assert all(band["count"] == 0 for band in facets["bands"])
+    for sort_by in ("name", "price"):
+        assert snapshot.query(52, 42, sort_by, limit=10) == ([], None)
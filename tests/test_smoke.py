@@ -0,0 +1,53 @@
+# Смоук-тесты Flask через test_client: страницы каталога открываются и отдают пакеты.
+# Запуск из корня репозитория: python -m pytest -q tests
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Отдельная временная база, настройки задаются до импорта приложения
+_scratch = tempfile.mkdtemp(prefix="truewood-test-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_scratch, 'test.db')}"
+
+from jinja2 import ChoiceLoader, DictLoader
+
+from database import SessionLocal
+from main import flask_app
+from migrations import migrate
+from models import RenovationPackage
+
+# Минимальные шаблоны на случай, если в окружении нет каталога templates
+FALLBACK_TEMPLATES = {
+    "catalog.html": "{% for package in packages %}{{ package.name }};{% endfor %}",
+    "about_package.html": "{{ package.name }}",
+}
+
+package_id = None
+
+
+def setup_module(module):
+    global package_id
+    migrate()
+    db = SessionLocal()
+    package = RenovationPackage(name="Smoke package", description="Smoke test", price=1000)
+    db.add(package)
+    db.commit()
+    package_id = package.id
+    db.close()
+    flask_app.jinja_env.loader = ChoiceLoader([flask_app.jinja_env.loader, DictLoader(FALLBACK_TEMPLATES)])
+
+
+def test_catalog_page():
+    response = flask_app.test_client().get("/catalog")
+    assert response.status_code == 200
+    assert b"Smoke package" in response.data
+
+
+def test_about_package_page():
+    client = flask_app.test_client()
+    response = client.get(f"/about_package/{package_id}")
+    assert response.status_code == 200
+    assert b"Smoke package" in response.data
+    assert client.get("/about_package/999999").status_code == 404
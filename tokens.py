@@ -0,0 +1,94 @@
+import hashlib
+import os
+import secrets
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, or_, select, update
+
+from models import RefreshToken, User
+
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+# Повтор того же токена в течение этого окна считаем гонкой параллельных запросов
+# (две вкладки обновляют сессию одновременно), а не кражей
+REUSE_GRACE_SECONDS = int(os.getenv("REFRESH_REUSE_GRACE_SECONDS", "10"))
+
+
+class RefreshTokenError(Exception):
+    pass
+
+
+# Токен только что обменян параллельным запросом той же сессии: новая пара уже выдана
+# победителю гонки, клиенту нужно просто сохранить свою cookie
+class RefreshTokenRaced(RefreshTokenError):
+    pass
+
+
+# Токен случайный и длинный, поэтому достаточно sha256 (bcrypt здесь не нужен)
+def _hash(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def issue_refresh_token(db, user_id: int, family_id: str = None) -> str:
+    token = secrets.token_urlsafe(32)
+    db.add(RefreshToken(
+        user_id=user_id,
+        token_hash=_hash(token),
+        family_id=family_id or uuid.uuid4().hex,
+        expires_at=datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    ))
+    return token
+
+
+# Обмен refresh-токена на новый (ротация). Возвращает (пользователь, новый refresh-токен)
+async def rotate_refresh_token(db, token: str):
+    now = datetime.utcnow()
+    row = await db.scalar(select(RefreshToken).where(RefreshToken.token_hash == _hash(token)))
+    if row is None or row.revoked or row.expires_at <= now:
+        raise RefreshTokenError("Invalid refresh token")
+
+    if row.used_at is not None:
+        if now - row.used_at <= timedelta(seconds=REUSE_GRACE_SECONDS):
+            raise RefreshTokenRaced("Refresh token already rotated")
+        # Повторное использование уже обмененного токена — отзываем всю цепочку
+        await revoke_family(db, row.family_id)
+        await db.commit()
+        raise RefreshTokenError("Refresh token already used")
+
+    user = await db.get(User, row.user_id)
+    if user is None:
+        raise RefreshTokenError("Invalid refresh token")
+
+    # Помечаем токен использованным условным UPDATE: из двух одновременных обменов
+    # одного токена проходит только один, второй считается повторным использованием
+    result = await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.id == row.id, RefreshToken.used_at.is_(None))
+        .values(used_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        await db.rollback()
+        raise RefreshTokenRaced("Refresh token already rotated")
+
+    new_token = issue_refresh_token(db, user.id, row.family_id)
+    await db.commit()
+    return user, new_token
+
+
+async def revoke_family(db, family_id: str):
+    await db.execute(update(RefreshToken).where(RefreshToken.family_id == family_id).values(revoked=True))
+
+
+# Истекшие и отозванные токены больше ничего не значат: предъявленный удаленный токен
+# отклоняется так же. Использованные, но не истекшие строки остаются — по ним ловится повтор
+async def purge_refresh_tokens(db):
+    result = await db.execute(
+        delete(RefreshToken).where(or_(RefreshToken.expires_at <= datetime.utcnow(), RefreshToken.revoked))
+    )
+    await db.commit()
+    return result.rowcount
+
+
+async def revoke_user_tokens(db, user_id: int):
+    await db.execute(update(RefreshToken).where(RefreshToken.user_id == user_id).values(revoked=True))
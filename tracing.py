@@ -0,0 +1,315 @@
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+
+# Трассировка медленных запросов (включается явно): дерево спанов (SQL, bcrypt, HTTP к API,
+# шаблоны) и семплированный профиль стека пишутся в ротируемый файл в формате JSON Lines.
+# Быстрые запросы стоят несколько присваиваний и одну блокировку, в файл попадают только медленные
+TRACE_ENABLED = os.getenv("TRACE_SLOW_REQUESTS", "") not in ("", "0")
+TRACE_THRESHOLD_MS = float(os.getenv("TRACE_THRESHOLD_MS", "500"))
+# Профиль стека снимается только с запросов, которые уже идут дольше этого времени
+TRACE_PROFILE_AFTER_MS = float(os.getenv("TRACE_PROFILE_AFTER_MS", str(TRACE_THRESHOLD_MS / 2)))
+TRACE_SAMPLE_INTERVAL_MS = float(os.getenv("TRACE_SAMPLE_INTERVAL_MS", "20"))
+TRACE_FILE = os.getenv("TRACE_FILE", "slow_requests.jsonl")
+TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", str(10 * 1024 * 1024)))
+TRACE_BACKUP_COUNT = int(os.getenv("TRACE_BACKUP_COUNT", "5"))
+TRACE_QUEUE_SIZE = 1000
+MAX_SPANS = 1000
+MAX_STACK_DEPTH = 64
+MAX_STACKS = 50
+MAX_SPAN_NAME = 200
+
+logger = logging.getLogger(__name__)
+
+_trace = ContextVar("trace", default=None)
+_span = ContextVar("trace_span", default=None)
+
+
+class Span:
+    __slots__ = ("trace", "kind", "name", "leaf", "parent", "index", "start", "duration", "_token")
+
+    def __init__(self, trace, kind, name, leaf=False):
+        self.trace = trace
+        self.kind = kind
+        self.name = name[:MAX_SPAN_NAME]
+        self.leaf = leaf
+        self.duration = None
+
+    def __enter__(self):
+        spans = self.trace.spans
+        self.parent = _span.get()
+        self.start = time.perf_counter()
+        self.index = len(spans) if len(spans) < MAX_SPANS else None
+        if self.index is not None:
+            spans.append(self)
+        # Листовые спаны (SQL) не меняют контекст: их закрывают события движка, а не with
+        if not self.leaf:
+            self._token = _span.set(self.index)
+        return self
+
+    def __exit__(self, *exc):
+        self.duration = time.perf_counter() - self.start
+        if not self.leaf:
+            _span.reset(self._token)
+        return False
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Trace:
+    __slots__ = ("app", "method", "path", "thread_id", "started", "started_at", "spans", "samples")
+
+    def __init__(self, app_name, method, path):
+        self.app = app_name
+        self.method = method
+        self.path = path
+        self.thread_id = threading.get_ident()
+        self.started = time.perf_counter()
+        self.started_at = time.time()
+        self.spans = []
+        self.samples = {}  # свернутый стек -> число попаданий
+
+    def to_record(self, status, elapsed):
+        nodes = []
+        roots = []
+        for span in self.spans:
+            node = {
+                "kind": span.kind,
+                "name": span.name,
+                "start_ms": round((span.start - self.started) * 1000, 3),
+                "duration_ms": None if span.duration is None else round(span.duration * 1000, 3),
+                "children": [],
+            }
+            nodes.append(node)
+            (nodes[span.parent]["children"] if span.parent is not None else roots).append(node)
+        stacks = sorted(self.samples.items(), key=lambda item: item[1], reverse=True)
+        return {
+            "time": datetime.fromtimestamp(self.started_at, timezone.utc).isoformat(),
+            "app": self.app,
+            "method": self.method,
+            "path": self.path,
+            "status": status,
+            "duration_ms": round(elapsed * 1000, 3),
+            "spans": roots,
+            "profile": {
+                "interval_ms": TRACE_SAMPLE_INTERVAL_MS,
+                "samples": sum(self.samples.values()),
+                "stacks": stacks[:MAX_STACKS],
+            },
+        }
+
+
+# Свернутый стек потока: "файл:функция;...", от корня к листу
+def _fold(frame):
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class Sampler:
+    # Фоновый поток раз в интервал снимает стеки потоков, где идут долгие запросы.
+    # В async-приложении все запросы делят поток event loop — профиль показывает,
+    # чем занят (или заблокирован) сам loop, пока запрос выполняется
+    def __init__(self, interval_ms=TRACE_SAMPLE_INTERVAL_MS, profile_after_ms=TRACE_PROFILE_AFTER_MS):
+        self.interval = interval_ms / 1000
+        self.profile_after = profile_after_ms / 1000
+        self._active = set()
+        self._lock = threading.Lock()
+
+    def register(self, trace):
+        with self._lock:
+            self._active.add(trace)
+
+    def unregister(self, trace):
+        with self._lock:
+            self._active.discard(trace)
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            now = time.perf_counter()
+            with self._lock:
+                traces = [trace for trace in self._active if now - trace.started >= self.profile_after]
+                if not traces:
+                    continue
+                frames = sys._current_frames()
+                for trace in traces:
+                    frame = frames.get(trace.thread_id)
+                    if frame is not None:
+                        stack = _fold(frame)
+                        trace.samples[stack] = trace.samples.get(stack, 0) + 1
+
+
+class Writer:
+    # Запись в файл — в отдельном потоке: запрос только кладет запись в очередь.
+    # Если диск не успевает, записи отбрасываются, а не тормозят запросы
+    def __init__(self, path=TRACE_FILE, max_bytes=TRACE_MAX_BYTES, backup_count=TRACE_BACKUP_COUNT):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=TRACE_QUEUE_SIZE)
+
+    def put(self, record):
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def run(self):
+        handler = RotatingFileHandler(self.path, maxBytes=self.max_bytes, backupCount=self.backup_count, encoding="utf-8")
+        while True:
+            record = self._queue.get()
+            try:
+                handler.emit(logging.makeLogRecord({"msg": json.dumps(record, ensure_ascii=False, default=str)}))
+            except Exception:
+                logger.exception("Failed to write slow request trace")
+
+
+sampler = Sampler()
+writer = Writer()
+_started_pid = None
+_start_lock = threading.Lock()
+
+
+# Потоки запускаются лениво и заново в каждом процессе (после fork воркера их нет)
+def _ensure_started():
+    global _started_pid
+    if _started_pid == os.getpid():
+        return
+    with _start_lock:
+        if _started_pid == os.getpid():
+            return
+        threading.Thread(target=sampler.run, name="trace-sampler", daemon=True).start()
+        threading.Thread(target=writer.run, name="trace-writer", daemon=True).start()
+        _started_pid = os.getpid()
+
+
+def span(kind, name, leaf=False):
+    if not TRACE_ENABLED:
+        return _NULL_SPAN
+    trace = _trace.get()
+    if trace is None:
+        return _NULL_SPAN
+    return Span(trace, kind, name, leaf)
+
+
+def start_trace(app_name, method, path):
+    if not TRACE_ENABLED:
+        return None
+    _ensure_started()
+    trace = Trace(app_name, method, path)
+    sampler.register(trace)
+    # Поток воркера переиспользуется: спан прошлого запроса не должен стать родителем
+    _span.set(None)
+    return _trace.set(trace)
+
+
+def finish_trace(token, status):
+    if token is None:
+        return
+    trace = _trace.get()
+    _trace.reset(token)
+    sampler.unregister(trace)
+    elapsed = time.perf_counter() - trace.started
+    if elapsed * 1000 >= TRACE_THRESHOLD_MS:
+        writer.put(trace.to_record(status, elapsed))
+
+
+if TRACE_ENABLED:
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    # SQL-спаны: события движка срабатывают и для async-сессий (в том же контексте задачи)
+    @event.listens_for(Engine, "before_cursor_execute")
+    def _trace_before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        trace = _trace.get()
+        if trace is not None:
+            db_span = Span(trace, "db", statement, leaf=True)
+            db_span.__enter__()
+            conn.info["trace_span"] = db_span
+
+    @event.listens_for(Engine, "after_cursor_execute")
+    def _trace_after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        db_span = conn.info.pop("trace_span", None)
+        if db_span is not None:
+            db_span.__exit__()
+
+
+class TracingMiddleware:
+    # ASGI-middleware для FastAPI; добавляется только при TRACE_SLOW_REQUESTS=1
+    def __init__(self, app, app_name="api"):
+        self.app = app
+        self.app_name = app_name
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = 500
+        token = start_trace(self.app_name, scope["method"], scope["path"])
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            finish_trace(token, status)
+
+
+def init_flask(flask_app, app_name="web"):
+    if not TRACE_ENABLED:
+        return
+    from flask import before_render_template, g, request, template_rendered
+
+    @flask_app.before_request
+    def trace_start():
+        g.trace_token = start_trace(app_name, request.method, request.path)
+
+    @flask_app.after_request
+    def trace_status(response):
+        g.trace_status = response.status_code
+        return response
+
+    @flask_app.teardown_request
+    def trace_finish(exc):
+        if "trace_token" in g:
+            finish_trace(g.trace_token, g.get("trace_status", 500 if exc else 200))
+
+    # Рендер Jinja: спан открывается перед рендером и закрывается после него
+    # (листовой — при ошибке рендера сигнал закрытия не придет)
+    def template_started(sender, template, context, **extra):
+        template_span = span("template", template.name or "<string>", leaf=True)
+        template_span.__enter__()
+        g.setdefault("trace_templates", []).append(template_span)
+
+    def template_finished(sender, template, context, **extra):
+        spans = g.get("trace_templates")
+        if spans:
+            spans.pop().__exit__()
+
+    before_render_template.connect(template_started, flask_app, weak=False)
+    template_rendered.connect(template_finished, flask_app, weak=False)